@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""Latency benchmark for mascot_tts.py against a local mock TTS engine.
+
+Starts a stand-in HTTP server that speaks the COEIROINK v2 endpoints
+(/v1/speakers, /v1/estimate_prosody, /v1/predict) and the VOICEVOX
+endpoints (/speakers, /audio_query, /synthesis) with configurable delays
+and payload sizes, then drives resolve_adapter() and synthesize_and_play()
+with a no-op player.
+
+Reports p50/p95/p99 (ms) per stage as JSON:
+  - startup:   spawning python and loading the mascot_tts.py script
+  - discovery: resolve_adapter() + speaker/style lookup
+  - synthesis: adapter.prepare() (engine round trips or cache hit)
+  - total:     resolve_adapter() + synthesize_and_play()
+
+"cold" runs each iteration against empty caches; "warm" reuses caches
+populated by a first call.
+
+With --startup-budget MS, only the start-up cost is checked instead: the
+median time to compile and run the mascot_tts.py script up to main(),
+importing mascot_tts_core on the way, must stay under MS, and none of
+LAZY_MODULES may be imported at start-up (`python -X importtime`). Exits 1
+on a regression.
+
+Usage:
+  python3 hooks/bench_mascot_tts.py [--iterations N] [--engine coeiroink]
+      [--speakers N] [--wav-seconds S] [--speakers-delay MS]
+      [--synthesis-delay MS] [--output FILE]
+  python3 hooks/bench_mascot_tts.py --startup-budget MS [--iterations N]
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOOKS_DIR)
+
+import mascot_tts_core  # noqa: E402
+
+ENGINES = ("coeiroink", "voicevox")
+MESSAGE = "テストが完了しました"
+
+HOOK_SCRIPT = os.path.join(HOOKS_DIR, "mascot_tts.py")
+
+# What python does to run the hook script, minus calling main(): compile
+# the source (a script's bytecode is never cached) and execute it.
+LOAD_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+with open(sys.argv[1], "rb") as f:
+    code = compile(f.read(), sys.argv[1], "exec")
+exec(code, {"__name__": "__startup__", "__file__": sys.argv[1]})
+print((time.perf_counter() - start) * 1000)
+"""
+
+# Modules mascot_tts_core must only import on the paths that use them
+LAZY_MODULES = (
+    "hashlib",
+    "http.client",
+    "logging.handlers",
+    "queue",
+    "socket",
+    "subprocess",
+    "tempfile",
+    "urllib.request",
+)
+
+
+# ── Mock Engine ───────────────────────────────────────────────
+
+
+def make_wav(seconds, rate=24000):
+    """Build a mono 16-bit WAV of a quiet square-ish tone."""
+    frames = int(seconds * rate)
+    samples = struct.pack(
+        f"<{frames}h", *((2000 if (i // 50) % 2 else -2000) for i in range(frames))
+    )
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples)
+    return buf.getvalue()
+
+
+def make_speakers(count):
+    """Build COEIROINK and VOICEVOX speaker lists with count entries each."""
+    coeiroink = [
+        {
+            "speakerName": f"speaker{i}",
+            "speakerUuid": f"00000000-0000-0000-0000-{i:012d}",
+            "styles": [{"styleName": "のーまる", "styleId": i * 10}],
+        }
+        for i in range(count)
+    ]
+    voicevox = [
+        {
+            "name": f"speaker{i}",
+            "speaker_uuid": f"00000000-0000-0000-0000-{i:012d}",
+            "styles": [
+                {"name": name, "id": i * 10 + j}
+                for j, name in enumerate(("ノーマル", "うれしい", "照れ", "困り"))
+            ],
+        }
+        for i in range(count)
+    ]
+    return json.dumps(coeiroink).encode(), json.dumps(voicevox).encode()
+
+
+class MockEngine:
+    """Threaded HTTP server answering both engines' endpoints."""
+
+    def __init__(self, speakers=50, wav_seconds=1.5, speakers_delay=0.0,
+                 synthesis_delay=0.0, port=0):
+        self.wav = make_wav(wav_seconds)
+        self.coeiroink_speakers, self.voicevox_speakers = make_speakers(speakers)
+        self.speakers_delay = speakers_delay
+        self.synthesis_delay = synthesis_delay
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def _handler(self):
+        engine = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Like the engines' asyncio servers; otherwise keep-alive
+            # responses stall on Nagle + delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body, content_type="application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/v1/speakers":
+                    time.sleep(engine.speakers_delay)
+                    self._send(engine.coeiroink_speakers)
+                elif path == "/speakers":
+                    time.sleep(engine.speakers_delay)
+                    self._send(engine.voicevox_speakers)
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                path = self.path.split("?")[0]
+                if path == "/v1/estimate_prosody":
+                    time.sleep(engine.synthesis_delay / 2)
+                    self._send(b'{"plain": [], "detail": []}')
+                elif path == "/audio_query":
+                    time.sleep(engine.synthesis_delay / 2)
+                    self._send(b'{"accent_phrases": [], "speedScale": 1.0}')
+                elif path in ("/v1/predict", "/synthesis"):
+                    time.sleep(engine.synthesis_delay / 2)
+                    self._send(engine.wav, "audio/wav")
+                else:
+                    self.send_error(404)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ── Measurement ───────────────────────────────────────────────
+
+
+def percentiles(samples):
+    """Return p50/p95/p99/mean in milliseconds for samples in seconds."""
+    return mascot_tts_core.percentiles([sample * 1000 for sample in samples])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return time.perf_counter() - start, value
+
+
+def measure_startup(iterations):
+    """Time a fresh interpreter loading the hook script."""
+    samples = []
+    for _ in range(iterations):
+        elapsed, _ = timed(
+            lambda: subprocess.run(
+                [sys.executable, "-c", LOAD_SCRIPT, HOOK_SCRIPT],
+                stdout=subprocess.DEVNULL, check=True,
+            )
+        )
+        samples.append(elapsed)
+    return samples
+
+
+def import_profile():
+    """Load the hook script in a fresh interpreter with -X importtime.
+
+    Returns (ms to compile and run the script, set of imported module
+    names).
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # mascot_tts_core from bytecode
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", LOAD_SCRIPT, HOOK_SCRIPT],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        modules.add(line.split("|")[2].strip())
+    return float(proc.stdout), modules
+
+
+def check_startup(budget_ms, iterations):
+    """Compare start-up cost against the budget. Returns (report, ok)."""
+    import_profile()  # write bytecode for the measured runs
+    samples, eager = [], set()
+    for _ in range(iterations):
+        total, modules = import_profile()
+        samples.append(total)
+        eager |= modules & set(LAZY_MODULES)
+    stats = mascot_tts_core.percentiles(samples)
+    report = {
+        "budget_ms": budget_ms,
+        "startup_ms": stats,
+        "eager_modules": sorted(eager),
+    }
+    return report, stats["p50"] <= budget_ms and not eager
+
+
+def discover(adapter):
+    if isinstance(adapter, mascot_tts_core.CoeiroinkAdapter):
+        return adapter.resolve_speaker()
+    return adapter.find_speaker_id("Joy")
+
+
+def run_once(make_config):
+    """Measure one utterance. Returns {stage: seconds}.
+
+    make_config() is called once for the per-stage pass and once for the
+    end-to-end pass, so cold runs can give each pass empty caches.
+    """
+    config = make_config()
+    discovery, adapter = timed(lambda: mascot_tts_core.resolve_adapter(config))
+    lookup, _ = timed(lambda: discover(adapter))
+    synthesis, prepared = timed(lambda: adapter.prepare(MESSAGE, "Joy"))
+    mascot_tts_core.discard_prepared(prepared)
+
+    config = make_config()
+    total, adapter = timed(lambda: mascot_tts_core.resolve_adapter(config))
+    played, _ = timed(lambda: adapter.synthesize_and_play(MESSAGE, "Joy"))
+    return {
+        "discovery": discovery + lookup,
+        "synthesis": synthesis,
+        "total": total + played,
+    }
+
+
+def bench_engine(engine, port, iterations, workdir):
+    results = {}
+    for mode in ("cold", "warm"):
+        samples = {"discovery": [], "synthesis": [], "total": []}
+        warm_cache = tempfile.mkdtemp(dir=workdir)
+
+        def make_config():
+            cache_dir = tempfile.mkdtemp(dir=workdir) if mode == "cold" else warm_cache
+            return {
+                "engine": engine,
+                f"{engine}_port": str(port),
+                "cache_dir": cache_dir,
+            }
+
+        for i in range(iterations + (1 if mode == "warm" else 0)):
+            stages = run_once(make_config)
+            if mode == "warm" and i == 0:
+                continue  # populates the caches
+            for stage, elapsed in stages.items():
+                samples[stage].append(elapsed)
+        results[mode] = {stage: percentiles(s) for stage, s in samples.items()}
+    return results
+
+
+def run_benchmarks(args, workdir):
+    """Run every benchmark with caches and sandboxed files under workdir."""
+    # Keep the benchmark away from the real signal file, player and env
+    mascot_tts_core.SIGNAL_FILE = os.path.join(workdir, "mascot_speaking")
+    mascot_tts_core.EVENT_JOURNAL = os.path.join(workdir, "mascot_events.jsonl")
+    mascot_tts_core.play_audio = lambda wav_path: None
+    os.environ.pop("TTS_ENGINE", None)
+    os.environ.pop("TTS_SPEAKER", None)
+
+    engine = MockEngine(
+        speakers=args.speakers,
+        wav_seconds=args.wav_seconds,
+        speakers_delay=args.speakers_delay / 1000,
+        synthesis_delay=args.synthesis_delay / 1000,
+    ).start()
+    try:
+        return {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "parameters": {
+                "iterations": args.iterations,
+                "speakers": args.speakers,
+                "wav_bytes": len(engine.wav),
+                "speakers_delay_ms": args.speakers_delay,
+                "synthesis_delay_ms": args.synthesis_delay,
+            },
+            "startup": percentiles(measure_startup(args.iterations)),
+            "engines": {
+                name: bench_engine(name, engine.port, args.iterations, workdir)
+                for name in (args.engine or ENGINES)
+            },
+        }
+    finally:
+        engine.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--engine", choices=ENGINES, action="append")
+    parser.add_argument("--speakers", type=int, default=50, help="speakers in the list")
+    parser.add_argument("--wav-seconds", type=float, default=1.5)
+    parser.add_argument("--speakers-delay", type=float, default=0, help="ms")
+    parser.add_argument("--synthesis-delay", type=float, default=0, help="ms")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument(
+        "--startup-budget", type=float, metavar="MS",
+        help="only check the hook script's start-up time against this budget",
+    )
+    args = parser.parse_args()
+
+    if args.startup_budget is not None:
+        report, ok = check_startup(args.startup_budget, args.iterations)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if ok else 1)
+
+    workdir = tempfile.mkdtemp(prefix="mascot_tts_bench_")
+    try:
+        report = run_benchmarks(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
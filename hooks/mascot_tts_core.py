@@ -0,0 +1,2849 @@
+"""Generic mascot TTS dispatcher with adapter pattern.
+
+Supports multiple TTS engines via adapters:
+  - coeiroink: COEIROINK v2 API (port 50032)
+  - voicevox:  VOICEVOX API (port 50021)
+  - none:      Signal file only (no audio), for testing
+
+Engine selection priority:
+  1. TTS_ENGINE environment variable
+  2. hooks/tts_config.toml file
+  3. Auto-detect (probe coeiroink and voicevox concurrently, else none;
+     the result is cached briefly and refreshed in the background)
+
+Adapters are built through the ADAPTERS registry; third-party engines are
+registered from tts_config.toml as adapter.NAME = "module:factory" and only
+imported when selected.
+
+Usage:
+  python3 hooks/mascot_tts.py --emotion KEY "message"
+  python3 hooks/mascot_tts.py --stream --emotion KEY "long message..."
+  python3 hooks/mascot_tts.py --enqueue --emotion KEY "message"
+  python3 hooks/mascot_tts.py --signal-dir DIR --emotion KEY "message"
+  python3 hooks/mascot_tts.py --task-id ID --emotion KEY "message"
+  python3 hooks/mascot_tts.py prewarm [--phrases FILE] [--workers N]
+  python3 hooks/mascot_tts.py stats [--last N]
+  python3 hooks/mascot_tts.py --serve
+  python3 hooks/mascot_tts.py --refresh-speakers
+
+With --serve, the dispatcher runs as a resident daemon on a local Unix
+socket, keeping config and the resolved adapter in memory. Regular hook
+invocations hand their message to the daemon when it is running (it
+acknowledges at once and speaks messages in arrival order) and fall back
+to in-process synthesis otherwise.
+
+With --signal-dir (or --task-id, meaning ~/.claude/utsutsu-code/task-ID/),
+the speaking signal goes to that directory instead of the main mascot's,
+and every signal write/clear is also appended to a shared event journal so
+the swarm overlay only has to look at the entities that changed.
+
+The hook itself is the small mascot_tts.py script, which imports this
+module: a script is recompiled on every run, a module is loaded from its
+cached bytecode.
+"""
+
+# Keep module-level imports to what every call needs: the hook runs once
+# per event, so start-up time is latency. Heavier modules (urllib, socket,
+# subprocess, tempfile, hashlib, ...) are imported where they are used.
+import contextlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+# The hook script; mascot_tts.py sets it to its own path, which may be a
+# symlink in ~/.claude/hooks/. tts_config.toml is read next to it.
+HOOK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mascot_tts.py")
+HOOK_TIMEOUT = 1  # seconds for availability check
+SYNTHESIS_TIMEOUT = 4  # seconds for synthesis
+LOG_DIR = os.path.expanduser("~/.claude/logs")
+LOG_FILE = os.path.join(LOG_DIR, "mascot_tts.log")
+LOG_MAX_BYTES = 1 << 20
+METRICS_FILE = os.path.join(LOG_DIR, "mascot_tts_metrics.jsonl")
+DEFAULT_METRICS_MAX_KB = 1024
+
+DEFAULT_MESSAGE = "Task completed"
+MAX_MESSAGE_LENGTH = 30
+MAX_STREAM_LENGTH = 400  # --stream speaks long text chunk by chunk
+STREAM_LOOKAHEAD = 2  # chunks synthesized ahead of playback
+LIPSYNC_FPS = 30  # amplitude envelope frames per second
+PLAYBACK_TIMEOUT = 5  # seconds, when the WAV's length can't be read
+PLAYBACK_MARGIN = 1  # seconds allowed beyond the WAV's length
+DEFAULT_SILENCE_THRESHOLD = 0.01  # of full scale (about -40 dBFS), 0 disables
+DEFAULT_SILENCE_PAD_MS = 40  # silence kept around the trimmed speech
+MAX_SPEED_SCALE = 2.0  # upper speedScale limit of both engines
+SIGNAL_FILE = os.path.expanduser("~/.claude/mascot_speaking")
+SIGNAL_NAME = "mascot_speaking"
+# Per-task signal dirs (task-{id}/) and the shared event journal live here
+SIGNAL_ROOT = os.path.expanduser("~/.claude/utsutsu-code")
+EVENT_JOURNAL = os.path.join(SIGNAL_ROOT, "mascot_events.jsonl")
+EVENT_JOURNAL_MAX_BYTES = 256 * 1024
+
+DAEMON_SOCKET = os.path.expanduser("~/.claude/mascot_tts.sock")
+DAEMON_CONNECT_TIMEOUT = 0.2  # seconds to reach a running daemon
+DAEMON_ACCEPT_TIMEOUT = 5  # seconds to wait for the daemon to accept a request
+DAEMON_WAIT_TIMEOUT = 180  # seconds a queue consumer waits for an utterance
+# Environment variables that select the voice, and the config keys they
+# override; hooks forward them to the daemon and queue consumer
+CLIENT_ENV = {"TTS_ENGINE": "engine", "TTS_SPEAKER": "speaker_name"}
+
+CACHE_DIR = os.path.expanduser("~/.claude/cache/mascot_tts")
+DEFAULT_CACHE_MAX_MB = 64
+DEFAULT_SPEAKER_CACHE_TTL = 3600  # seconds
+DEFAULT_DETECT_CACHE_TTL = 30  # seconds
+DEFAULT_HTTP_RETRIES = 2  # extra attempts for idempotent engine calls
+HTTP_BACKOFF = 0.05  # seconds, base of the jittered exponential backoff
+DEFAULT_BREAKER_THRESHOLD = 3  # consecutive failures that open the circuit
+DEFAULT_BREAKER_COOLDOWN = 30  # seconds an open circuit skips the engine
+POOL_STATS_TTL = 600  # seconds before an idle instance's latency is forgotten
+POOL_LATENCY_ALPHA = 0.3  # weight of the newest synthesis in the latency EWMA
+POOL_ERROR_BACKOFF = 30  # seconds a failed instance ranks after healthy ones
+DEFAULT_ENGINE_PRIORITY = "coeiroink,voicevox"
+DEFAULT_QUEUE_MAX_AGE = 30  # seconds before a queued utterance is dropped
+DEFAULT_QUEUE_MAX_DEPTH = 5
+DEFAULT_QUEUE_COALESCE = "replace"  # "replace", "merge" or "off"
+DEFAULT_PREWARM_WORKERS = 4
+EMOTIONS_FILE_CANDIDATES = (
+    "../mascot/config/emotions.toml",
+    "../../mascot/config/emotions.toml",
+    "../emotions.toml",
+)
+
+# Default ports
+COEIROINK_PORT = 50032
+VOICEVOX_PORT = 50021
+
+
+def rotate_file(path, max_bytes):
+    """Move path aside to path.1 once it has grown to max_bytes."""
+    try:
+        if os.path.getsize(path) >= max_bytes:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass
+
+
+def setup_logging(resident=False):
+    """Log to LOG_FILE, rotated at start-up.
+
+    Hook calls are short-lived, so checking the size once is enough and
+    avoids importing logging.handlers. A resident process (the daemon)
+    rotates while it runs instead.
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
+    if resident:
+        from logging.handlers import RotatingFileHandler
+
+        handler = RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=1
+        )
+    else:
+        rotate_file(LOG_FILE, LOG_MAX_BYTES)
+        handler = logging.FileHandler(LOG_FILE)
+    logging.basicConfig(
+        handlers=[handler],
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        force=True,
+    )
+
+
+# ── Timings ───────────────────────────────────────────────────
+
+
+class Timings:
+    """Monotonic-clock spans (ms) for one hook call.
+
+    Spans with the same name accumulate, so e.g. every HTTP call to one
+    endpoint during a streamed message adds up under one key. Thread-safe
+    for the streaming and prewarm workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds * 1000
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def as_dict(self):
+        with self._lock:
+            return {name: round(ms, 2) for name, ms in self.spans.items()}
+
+
+TIMINGS = Timings()
+
+
+def record_metrics(config, result):
+    """Append one JSON line for this call to the size-rotated metrics file."""
+    max_bytes = float(config.get("metrics_max_kb", DEFAULT_METRICS_MAX_KB)) * 1024
+    if max_bytes <= 0:
+        return
+    line = {
+        "time": round(time.time(), 3),
+        "status": result.get("status"),
+        "engine": result.get("engine"),
+        "instance": result.get("instance"),
+        "emotion": result.get("emotion"),
+        "timings": result.get("timings", {}),
+    }
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        rotate_file(METRICS_FILE, max_bytes)
+        with open(METRICS_FILE, "a") as f:
+            f.write(json.dumps(line) + "\n")
+    except OSError as e:
+        logging.warning("Metrics write failed: %s", e)
+
+
+def percentiles(values):
+    """Return nearest-rank p50/p95/p99, mean and count for a list of numbers."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+        return round(ordered[index], 3)
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "n": len(ordered),
+    }
+
+
+def metrics_stats(last=None):
+    """Aggregate per-stage percentiles (ms) from the metrics file(s)."""
+    lines = []
+    for path in (METRICS_FILE + ".1", METRICS_FILE):
+        try:
+            with open(path) as f:
+                lines.extend(f)
+        except OSError:
+            pass
+    if last:
+        lines = lines[-last:]
+
+    stages = {}
+    for line in lines:
+        try:
+            timings = json.loads(line).get("timings", {})
+        except ValueError:
+            continue
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms)
+    return {
+        "calls": len(lines),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+    }
+
+
+def load_config():
+    """Load TTS config from hooks/tts_config.toml if it exists."""
+    config_path = os.path.join(os.path.dirname(HOOK_SCRIPT), "tts_config.toml")
+    if not os.path.exists(config_path):
+        return {}
+    config = {}
+    with open(config_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "=" in line:
+                key, val = line.split("=", 1)
+                key = key.strip()
+                val = val.strip().strip('"')
+                config[key] = val
+    return config
+
+
+def client_env():
+    """The CLIENT_ENV variables set in this process."""
+    return {name: os.environ[name] for name in CLIENT_ENV if os.environ.get(name)}
+
+
+def env_config(config, env):
+    """config with the CLIENT_ENV variables in env applied as config keys."""
+    return {
+        **config,
+        **{key: env[name] for name, key in CLIENT_ENV.items() if env.get(name)},
+    }
+
+
+def atomic_write(path, data):
+    """Write bytes to path via a temp file + rename in the same directory."""
+    import tempfile
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def signal_path(signal_dir=None, task_id=None):
+    """Return the speaking signal file for a task, or the default one.
+
+    Relative signal dirs are resolved under SIGNAL_ROOT, so both
+    "task-abc/" and an absolute path work.
+    """
+    if task_id:
+        signal_dir = f"task-{task_id}"
+    if not signal_dir:
+        return SIGNAL_FILE
+    directory = os.path.join(SIGNAL_ROOT, os.path.expanduser(signal_dir))
+    return os.path.join(os.path.normpath(directory), SIGNAL_NAME)
+
+
+@contextlib.contextmanager
+def signal_route(path):
+    """Point write_signal()/clear_signal() at path for the duration."""
+    global SIGNAL_FILE
+    previous = SIGNAL_FILE
+    if path:
+        SIGNAL_FILE = path
+    try:
+        yield
+    finally:
+        SIGNAL_FILE = previous
+
+
+def journal_event(event, payload=None):
+    """Append one signal event to the shared, size-rotated event journal.
+
+    Lines stay well under PIPE_BUF so concurrent O_APPEND writers don't
+    interleave. The envelope is left out; readers fetch it from the signal.
+    """
+    line = {
+        "time_ms": int(time.time() * 1000),
+        "event": event,
+        "signal_dir": os.path.dirname(SIGNAL_FILE),
+    }
+    if payload:
+        line["message"] = payload.get("message", "")[:MAX_STREAM_LENGTH // 4]
+        line["emotion"] = payload.get("emotion")
+    try:
+        os.makedirs(os.path.dirname(EVENT_JOURNAL), exist_ok=True)
+        rotate_file(EVENT_JOURNAL, EVENT_JOURNAL_MAX_BYTES)
+        with open(EVENT_JOURNAL, "a") as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning("Event journal write failed: %s", e)
+
+
+def write_signal(text, emotion=None, envelope=None):
+    """Write the mascot speaking signal file.
+
+    With an envelope, the signal also carries the lip-sync amplitude
+    envelope and the playback start time (epoch ms) so the mascot can
+    drive its mouth from the audio.
+    """
+    if envelope:
+        signal = json.dumps(
+            {
+                "message": text,
+                "emotion": emotion,
+                "envelope": envelope,
+                "started_at_ms": int(time.time() * 1000),
+            }
+        )
+    elif emotion:
+        signal = json.dumps({"message": text, "emotion": emotion})
+    else:
+        signal = text
+    with TIMINGS.span("signal_write"):
+        # Atomic so pollers never read a half-written signal
+        atomic_write(SIGNAL_FILE, signal.encode())
+        journal_event("speak", {"message": text, "emotion": emotion})
+
+
+def clear_signal():
+    """Remove the mascot speaking signal file."""
+    with TIMINGS.span("signal_clear"):
+        try:
+            os.unlink(SIGNAL_FILE)
+        except OSError:
+            return
+        journal_event("clear")
+
+
+def notify_osascript(message):
+    """Fallback: show macOS notification."""
+    import subprocess
+
+    subprocess.run(
+        [
+            "osascript",
+            "-e",
+            f'display notification "{message}" with title "Mascot TTS"',
+        ],
+        check=False,
+        timeout=3,
+    )
+
+
+def wav_duration(source):
+    """Length in seconds of a WAV file or WAV bytes, or None if unreadable."""
+    import io
+    import wave
+
+    try:
+        with wave.open(io.BytesIO(source) if isinstance(source, bytes) else source) as w:
+            return w.getnframes() / w.getframerate()
+    except (OSError, EOFError, wave.Error, ZeroDivisionError):
+        return None
+
+
+def play_audio(wav_path):
+    """Play a WAV file and wait for it to finish.
+
+    The player is given the clip's length plus a margin, so long clips are
+    not cut off but a hung player still is.
+    """
+    import subprocess
+
+    duration = wav_duration(wav_path)
+    timeout = duration + PLAYBACK_MARGIN if duration is not None else PLAYBACK_TIMEOUT
+    with TIMINGS.span("playback"):
+        subprocess.run(["afplay", wav_path], timeout=timeout, check=False)
+
+
+def loaded_numpy():
+    """NumPy if this process already imported it, else None.
+
+    Importing NumPy takes ~100 ms, more than the stdlib passes over a
+    hook-sized clip, so only long-running modes (--serve, prewarm) load it
+    up front with preload_numpy().
+    """
+    return sys.modules.get("numpy")
+
+
+def preload_numpy():
+    with contextlib.suppress(ImportError):
+        import numpy  # noqa: F401
+
+
+def compute_envelope(source, fps=LIPSYNC_FPS):
+    """Compute a lip-sync amplitude envelope for a WAV file or WAV bytes.
+
+    Returns {"fps", "values"} with one RMS value per 1/fps second,
+    normalized to the clip's peak, or None if the WAV can't be decoded.
+    Uses NumPy for a single vectorized pass when it is loaded.
+    """
+    import io
+    import wave
+
+    try:
+        with wave.open(io.BytesIO(source) if isinstance(source, bytes) else source) as w:
+            width = w.getsampwidth()
+            channels = w.getnchannels()
+            rate = w.getframerate()
+            raw = w.readframes(w.getnframes())
+    except (OSError, EOFError, wave.Error):
+        return None
+    if width not in (2, 4):
+        return None
+
+    window = max(1, rate // fps) * channels
+    numpy = loaded_numpy()
+    if numpy is not None:
+        samples = numpy.frombuffer(raw, dtype="<i2" if width == 2 else "<i4")
+        count = -(-len(samples) // window)
+        padded = numpy.zeros(count * window)
+        padded[: len(samples)] = samples
+        values = numpy.sqrt((padded.reshape(count, window) ** 2).mean(axis=1)).tolist()
+    else:
+        import array
+        import math
+
+        samples = array.array("h" if width == 2 else "i")
+        samples.frombytes(raw)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        values = [
+            math.sqrt(sum(x * x for x in samples[i : i + window]) / window)
+            for i in range(0, len(samples), window)
+        ]
+
+    peak = max(values, default=0)
+    return {
+        "fps": fps,
+        "values": [round(v / peak, 2) if peak else 0.0 for v in values],
+    }
+
+
+def envelope_sidecar(wav_path):
+    return os.path.splitext(wav_path)[0] + ".env.json"
+
+
+def load_envelope(wav_path):
+    """Return the envelope for a WAV, from its cache sidecar when present."""
+    try:
+        with open(envelope_sidecar(wav_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    with TIMINGS.span("envelope"):
+        return compute_envelope(wav_path)
+
+
+def play_wav_file(wav_path, text, emotion=None):
+    """Play a WAV file while the speaking signal is up."""
+    try:
+        write_signal(text, emotion, load_envelope(wav_path))
+        play_audio(wav_path)
+    finally:
+        clear_signal()
+
+
+def write_temp_wav(wav_data):
+    """Write WAV data to a temporary file and return its path."""
+    import tempfile
+
+    with TIMINGS.span("wav_write"), tempfile.NamedTemporaryFile(
+        suffix=".wav", delete=False
+    ) as f:
+        f.write(wav_data)
+        return f.name
+
+
+def discard_prepared(prepared):
+    """Delete a prepared WAV if it is a temporary file."""
+    wav_path, is_temp = prepared
+    if is_temp:
+        try:
+            os.unlink(wav_path)
+        except OSError:
+            pass
+
+
+def play_prepared(prepared, text, emotion=None):
+    """Play a (wav_path, is_temp) pair from an adapter's prepare()."""
+    try:
+        play_wav_file(prepared[0], text, emotion)
+    finally:
+        discard_prepared(prepared)
+
+
+# ── WAV Processing ────────────────────────────────────────────
+
+
+class AudioProcessor:
+    """Post-synthesis processing of the engine's WAV before it is cached.
+
+    - Leading/trailing silence (peak below threshold × full scale) is
+      trimmed, keeping pad_ms around the speech.
+    - Clips longer than max_duration seconds are re-synthesized once at the
+      speedScale that fits them (adapters that can predict the length, like
+      VOICEVOX, pick it up front via fit_speed()).
+    - mono downmixes and rate downsamples (box-filtered decimation) to
+      shrink cached entries and the player's start-up.
+
+    Only 16-bit PCM is processed; other formats pass through unchanged.
+    Uses NumPy for vectorized passes when it is loaded, else array.
+    """
+
+    def __init__(self, threshold=DEFAULT_SILENCE_THRESHOLD,
+                 pad_ms=DEFAULT_SILENCE_PAD_MS, max_duration=0.0, rate=0,
+                 mono=False):
+        self.threshold = threshold
+        self.pad_ms = pad_ms
+        self.max_duration = max_duration
+        self.rate = rate
+        self.mono = mono
+
+    @property
+    def signature(self):
+        """Settings that change the output, for WAV cache keys."""
+        return [self.threshold, self.pad_ms, self.max_duration, self.rate, self.mono]
+
+    def fit_speed(self, duration, speed):
+        """speedScale that brings a clip of duration seconds (synthesized at
+        speed) within max_duration, or None if it already fits."""
+        if not self.max_duration or duration <= self.max_duration:
+            return None
+        if speed >= MAX_SPEED_SCALE:
+            return None
+        import math
+
+        # The kept silence pad doesn't shrink with speedScale
+        pad = 2 * self.pad_ms / 1000 if self.threshold > 0 else 0.0
+        ratio = (duration - pad) / max(self.max_duration - pad, 0.1)
+        return min(MAX_SPEED_SCALE, math.ceil(speed * ratio * 100) / 100)
+
+    def render(self, synthesize, speed):
+        """Call synthesize(speed) and return the processed WAV bytes.
+
+        synthesize returns (WAV bytes, speedScale sent to the engine); the
+        engine may have sped up already, and a re-synthesis starts from that.
+        """
+        wav_data, speed = synthesize(speed)
+        with TIMINGS.span("postprocess"):
+            processed, duration = self.process(wav_data)
+        faster = self.fit_speed(duration, speed) if duration is not None else None
+        if faster is None:
+            return processed
+        logging.info("Clip is %.1fs, re-synthesizing at speedScale %s", duration, faster)
+        wav_data, _ = synthesize(faster)
+        with TIMINGS.span("postprocess"):
+            return self.process(wav_data)[0]
+
+    def process(self, wav_data):
+        """Trim, downmix and downsample WAV bytes. Returns (wav bytes, seconds)."""
+        import io
+        import wave
+
+        try:
+            with wave.open(io.BytesIO(wav_data)) as w:
+                channels = w.getnchannels()
+                width = w.getsampwidth()
+                rate = w.getframerate()
+                raw = w.readframes(w.getnframes())
+        except (OSError, EOFError, wave.Error):
+            return wav_data, None
+        if width != 2 or not raw:
+            return wav_data, wav_duration(wav_data)
+
+        numpy = loaded_numpy()
+        if numpy is not None:
+            samples = numpy.frombuffer(raw, dtype="<i2")
+        else:
+            import array
+
+            samples = array.array("h")
+            samples.frombytes(raw)
+            if sys.byteorder == "big":
+                samples.byteswap()
+
+        if self.threshold > 0:
+            samples = self._trim(numpy, samples, channels, rate)
+        if self.mono and channels > 1:
+            samples = self._downmix(numpy, samples, channels)
+            channels = 1
+        if self.rate and self.rate < rate:
+            samples = self._downsample(numpy, samples, channels, rate, self.rate)
+            rate = self.rate
+
+        if numpy is not None:
+            raw = samples.astype("<i2").tobytes()
+        else:
+            if sys.byteorder == "big":
+                samples.byteswap()
+            raw = samples.tobytes()
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(raw)
+        return buf.getvalue(), len(raw) // (2 * channels) / rate
+
+    def _trim(self, numpy, samples, channels, rate):
+        limit = self.threshold * 32767
+        if numpy is not None:
+            loud = numpy.flatnonzero(numpy.abs(samples.astype(numpy.int32)) > limit)
+            if not len(loud):
+                return samples
+            first, last = int(loud[0]), int(loud[-1])
+        else:
+            first = next((i for i, x in enumerate(samples) if abs(x) > limit), None)
+            if first is None:
+                return samples
+            last = next(
+                i for i in range(len(samples) - 1, -1, -1) if abs(samples[i]) > limit
+            )
+        pad = int(rate * self.pad_ms / 1000)
+        start = max(0, first // channels - pad)
+        end = min(len(samples) // channels, last // channels + 1 + pad)
+        return samples[start * channels : end * channels]
+
+    @staticmethod
+    def _downmix(numpy, samples, channels):
+        if numpy is not None:
+            frames = len(samples) // channels
+            frame_sums = samples[: frames * channels].reshape(frames, channels).astype(
+                numpy.int32
+            ).sum(axis=1)
+            return frame_sums // channels
+        import array
+
+        return array.array("h", (
+            sum(samples[i : i + channels]) // channels
+            for i in range(0, len(samples) - channels + 1, channels)
+        ))
+
+    @staticmethod
+    def _downsample(numpy, samples, channels, src, dst):
+        """Average each output frame's window of input frames (a box
+        low-pass, so speech above the new Nyquist doesn't alias)."""
+        frames = len(samples) // channels
+        count = frames * dst // src
+        width = -(-src // dst)
+        if numpy is not None:
+            starts = numpy.arange(count) * src // dst
+            ends = numpy.minimum(starts + width, frames)
+            data = samples[: frames * channels].reshape(frames, channels).astype(numpy.int64)
+            sums = numpy.vstack([numpy.zeros((1, channels), numpy.int64), data.cumsum(axis=0)])
+            means = (sums[ends] - sums[starts]) // (ends - starts)[:, None]
+            return means.reshape(-1)
+        import array
+        import itertools
+
+        windows = [
+            (j * src // dst, min(j * src // dst + width, frames)) for j in range(count)
+        ]
+        columns = []
+        for c in range(channels):
+            sums = [0, *itertools.accumulate(samples[c : frames * channels : channels])]
+            columns.append([(sums[end] - sums[start]) // (end - start) for start, end in windows])
+        return array.array("h", (value for frame in zip(*columns) for value in frame))
+
+
+def render_wav(audio, synthesize, speed):
+    """WAV bytes from synthesize(speed) -> (bytes, speedScale sent),
+    post-processed by audio when it is set."""
+    if audio is None:
+        return synthesize(speed)[0]
+    return audio.render(synthesize, speed)
+
+
+# ── WAV Cache ─────────────────────────────────────────────────
+
+
+class WavCache:
+    """Content-addressed on-disk WAV cache with LRU eviction.
+
+    Entries are named by a hash of the synthesis parameters. Hits bump the
+    file mtime, and stores evict the least recently used entries until the
+    cache fits in max_bytes. Writes go through a temp file + rename so
+    concurrent hook processes never see a partial entry. Each entry has a
+    <key>.env.json sidecar with its lip-sync envelope.
+    """
+
+    def __init__(self, directory=os.path.join(CACHE_DIR, "wav"),
+                 max_bytes=DEFAULT_CACHE_MAX_MB << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(*parts):
+        import hashlib
+
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def lookup(self, key):
+        """Return the cached WAV path for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def store(self, key, wav_data):
+        """Store WAV data under key. Returns the entry path, or None on failure."""
+        path = self._path(key)
+        try:
+            with TIMINGS.span("wav_write"):
+                atomic_write(path, wav_data)
+        except OSError as e:
+            logging.warning("WAV cache store failed: %s", e)
+            return None
+
+        with TIMINGS.span("envelope"):
+            envelope = compute_envelope(wav_data)
+        if envelope is not None:
+            try:
+                atomic_write(envelope_sidecar(path), json.dumps(envelope).encode())
+            except OSError as e:
+                logging.warning("Envelope cache store failed: %s", e)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used entries until under the byte budget."""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(".wav"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            try:
+                os.unlink(envelope_sidecar(path))
+            except OSError:
+                pass
+            total -= size
+
+
+def fetch_wav(cache, key, synthesize):
+    """Return (wav_path, is_temp) for key, calling synthesize() on a miss.
+
+    Cached entries are returned in place; without a cache the audio goes
+    to a temporary file the caller must discard.
+    """
+    path = cache.lookup(key) if cache else None
+    if path is not None:
+        logging.info("WAV cache hit")
+        return path, False
+
+    wav_data = synthesize()
+    path = cache.store(key, wav_data) if cache else None
+    if path is not None:
+        return path, False
+    return write_temp_wav(wav_data), True
+
+
+# ── Discovery Caches ──────────────────────────────────────────
+
+
+class TTLStore:
+    """Small JSON file of keyed entries that expire after ttl seconds.
+
+    Used to persist speaker/style discovery (keyed by engine, base URL and
+    speaker name), engine auto-detection, circuit breaker state and engine
+    pool stats across hook processes. The file is re-read on every lookup
+    so a --refresh-speakers from another process is picked up by the daemon.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        try:
+            atomic_write(self.path, json.dumps(entries, ensure_ascii=False).encode())
+        except OSError as e:
+            logging.warning("Cache write to %s failed: %s", self.path, e)
+
+    def get(self, key):
+        data, fresh = self.get_entry(key)
+        return data if fresh else None
+
+    def get_entry(self, key):
+        """Return (data, fresh), including expired entries; (None, False) if absent."""
+        entry = self._load().get(key)
+        if not entry:
+            return None, False
+        return entry["data"], time.time() - entry.get("time", 0) < self.ttl
+
+    def items(self):
+        """Return {key: data} for all fresh entries."""
+        now = time.time()
+        return {
+            key: entry["data"]
+            for key, entry in self._load().items()
+            if now - entry.get("time", 0) < self.ttl
+        }
+
+    def put(self, key, data):
+        entries = self._load()
+        entries[key] = {"time": time.time(), "data": data}
+        self._save(entries)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Hold an exclusive lock shared by all processes across a
+        read-modify-write of the store (a no-op without fcntl).
+
+        Not reentrant: don't call update() inside it.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def update(self, key, fn):
+        """Replace key's data with fn(current data or None) under locked().
+
+        For counters updated by concurrent processes.
+        """
+        with self.locked():
+            entries = self._load()
+            entry = entries.get(key)
+            fresh = entry and time.time() - entry.get("time", 0) < self.ttl
+            entries[key] = {
+                "time": time.time(),
+                "data": fn(entry["data"] if fresh else None),
+            }
+            self._save(entries)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or all entries when key is None.
+
+        Returns True if anything was removed.
+        """
+        if key is None:
+            try:
+                os.unlink(self.path)
+                return True
+            except OSError:
+                return False
+        entries = self._load()
+        if entries.pop(key, None) is None:
+            return False
+        self._save(entries)
+        return True
+
+
+# ── HTTP Transport ────────────────────────────────────────────
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling an engine whose circuit breaker is open."""
+
+
+class HTTPTransport:
+    """Keep-alive HTTP/1.1 client for one engine base URL.
+
+    Idle connections are pooled and reused, so the discovery, prosody and
+    synthesis calls of an utterance share one TCP connection (and, in the
+    daemon and prewarm, all later ones too). A connection the server closed
+    while idle is replaced transparently. Idempotent (GET) calls are retried
+    with jittered exponential backoff on connection errors and 5xx.
+
+    A circuit breaker counts consecutive failures (connection errors,
+    timeouts, 5xx) per base URL in a TTLStore shared by all hook processes,
+    updated under the store's lock. At threshold failures the circuit opens:
+    calls fail immediately with CircuitOpenError until the cooldown (the
+    store's ttl) has passed. The circuit is then half-open: the first
+    request(), in any process, re-stamps the entry to claim a trial call
+    and everyone else keeps failing fast. is_open() only reads the state,
+    so adapter resolution and pool ranking don't claim the trial. The trial closes the circuit on success
+    and re-opens it on failure; if it never reports back, the next trial is
+    allowed one cooldown later.
+    """
+
+    def __init__(self, base_url, breaker=None, threshold=DEFAULT_BREAKER_THRESHOLD,
+                 retries=DEFAULT_HTTP_RETRIES):
+        from urllib.parse import urlsplit
+
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = parts.hostname
+        self.port = parts.port
+        self.breaker = breaker
+        self.threshold = threshold
+        self.retries = retries
+        self._idle = []
+        self._lock = threading.Lock()
+        self._tripped = False
+
+    # Circuit breaker
+
+    def is_open(self):
+        """Whether calls are being rejected (a circuit past its cooldown
+        reads as closed, since the next request may be its trial)."""
+        if self.breaker is None:
+            return False
+        data, fresh = self.breaker.get_entry(self.base_url)
+        return bool(fresh and data.get("open"))
+
+    def _admit(self):
+        """Let a request through the breaker, claiming the half-open trial
+        when the cooldown has passed. Returns False to reject it."""
+        if self.breaker is None:
+            return True
+        data, fresh = self.breaker.get_entry(self.base_url)
+        self._tripped = data is not None
+        if not (data and data.get("open")):
+            return True
+        if fresh:
+            return False  # open, or half-open with another caller's trial running
+
+        with self.breaker.locked():
+            data, fresh = self.breaker.get_entry(self.base_url)
+            if not (data and data.get("open")):
+                return True  # closed by a trial meanwhile
+            if fresh:
+                return False  # another caller claimed the trial
+            self.breaker.put(self.base_url, data)
+        logging.info("Circuit half-open for %s, sending a trial call", self.base_url)
+        return True
+
+    def _record_failure(self):
+        if self.breaker is None:
+            return
+        with self.breaker.locked():
+            data, fresh = self.breaker.get_entry(self.base_url)
+            # A failed trial call re-opens the circuit at once
+            was_open = bool(data and data.get("open"))
+            failures = data["failures"] + 1 if data and (fresh or was_open) else 1
+            opened = failures >= self.threshold
+            self.breaker.put(self.base_url, {"failures": failures, "open": opened})
+        if opened and not was_open:
+            logging.warning("Circuit opened for %s after %d failures",
+                            self.base_url, failures)
+        self._tripped = True
+
+    def _record_success(self):
+        if self._tripped:
+            with self.breaker.locked():
+                self.breaker.invalidate(self.base_url)
+            self._tripped = False
+
+    # Connections
+
+    def _connect(self, timeout, reuse=True):
+        with self._lock:
+            if reuse and self._idle:
+                conn = self._idle.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.timeout = timeout
+                return conn, True
+        import http.client
+
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout), False
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _send(self, method, path, body, timeout):
+        """One round trip. Returns (status, reason, headers, body bytes)."""
+        import socket
+
+        conn, reused = self._connect(timeout)
+        headers = {"Content-Type": "application/json"} if body else {}
+        try:
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except socket.timeout:
+                raise
+            except OSError:
+                if not reused:
+                    raise
+                # Closed by the server while idle (and so are the other idle
+                # ones, most likely): retry once on a fresh connection
+                conn.close()
+                self.close()
+                conn, _ = self._connect(timeout, reuse=False)
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            data = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        return resp.status, resp.reason, resp.headers, data
+
+    def request(self, method, path, body=None, timeout=HOOK_TIMEOUT, retries=None):
+        """Send a request and return the response body.
+
+        Raises urllib.error.HTTPError for 4xx/5xx responses (4xx don't count
+        as engine failures), CircuitOpenError while the circuit is open, and
+        OSError for connection errors and timeouts.
+        """
+        import random
+        import socket
+        import urllib.error
+
+        if not self._admit():
+            raise CircuitOpenError(f"circuit open for {self.base_url}")
+        if retries is None:
+            retries = self.retries if method == "GET" else 0
+
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0, HTTP_BACKOFF * 2 ** attempt))
+            try:
+                status, reason, headers, data = self._send(method, path, body, timeout)
+            except socket.timeout:
+                # A hung engine: retrying would only multiply the wait
+                self._record_failure()
+                raise
+            except OSError:
+                if attempt < retries:
+                    continue
+                self._record_failure()
+                raise
+            if status < 400:
+                self._record_success()
+                return data
+            if status >= 500 and attempt < retries:
+                continue
+            if status >= 500:
+                self._record_failure()
+            else:
+                self._record_success()
+            raise urllib.error.HTTPError(
+                f"{self.base_url}{path}", status, reason, headers, None
+            )
+
+
+TRANSPORTS = {}
+
+
+def get_transport(base_url, **settings):
+    """Return the shared transport for base_url, creating it on first use.
+
+    Connections are kept per base URL for the life of the process. settings
+    (breaker, threshold, retries) update the transport; the most recently
+    built adapter's settings win.
+    """
+    transport = TRANSPORTS.get(base_url)
+    if transport is None:
+        transport = TRANSPORTS[base_url] = HTTPTransport(base_url)
+    for name, value in settings.items():
+        setattr(transport, name, value)
+    return transport
+
+
+def api_request(base_url, path, data=None, timeout=HOOK_TIMEOUT, method=None,
+                retries=None):
+    """Make a request to a TTS API and return the response body."""
+    body = json.dumps(data).encode() if data is not None else None
+    method = method or ("POST" if body else "GET")
+    with TIMINGS.span(f"http {method} {path.split('?')[0]}"):
+        return get_transport(base_url).request(method, path, body, timeout, retries)
+
+
+# ── Adapters ──────────────────────────────────────────────────
+
+
+def prepare_with_retry(adapter, text, emotion=None):
+    """Run adapter.prepare(), re-discovering the speaker once on HTTP 4xx.
+
+    A client error usually means the cached speaker or style no longer
+    exists (model uninstalled, engine restarted with other voices).
+    """
+    import urllib.error
+
+    try:
+        return adapter.prepare(text, emotion)
+    except urllib.error.HTTPError as e:
+        if not 400 <= e.code < 500 or not adapter.speakers:
+            raise
+        if not adapter.speakers.invalidate(adapter.speaker_key):
+            raise
+        logging.info("Speaker cache invalidated after HTTP %s", e.code)
+        return adapter.prepare(text, emotion)
+
+
+class CoeiroinkAdapter:
+    """COEIROINK v2 API adapter."""
+
+    def __init__(self, port=COEIROINK_PORT, speaker_name=None, speed=1.0,
+                 cache=None, speakers=None, transport=None, base_url=None,
+                 audio=None):
+        self.base_url = base_url or f"http://localhost:{port}"
+        self.transport = get_transport(self.base_url, **(transport or {}))
+        self.speaker_name = speaker_name
+        self.speed = speed
+        self.cache = cache
+        self.audio = audio
+        self.speakers = speakers
+        self.speaker_key = f"coeiroink|{self.base_url}|{speaker_name or ''}"
+
+    def is_available(self):
+        try:
+            api_request(self.base_url, "/v1/speakers", retries=0)
+            return True
+        except Exception:
+            return False
+
+    def find_speaker(self):
+        """Find speaker by name. Returns (speakerUuid, styleId)."""
+        speakers = json.loads(api_request(self.base_url, "/v1/speakers"))
+
+        for speaker in speakers:
+            name = speaker.get("speakerName", "")
+            if self.speaker_name and self.speaker_name in name:
+                styles = speaker.get("styles", [])
+                if styles:
+                    return speaker["speakerUuid"], styles[0]["styleId"]
+            elif not self.speaker_name:
+                # Use first speaker if no name specified
+                styles = speaker.get("styles", [])
+                if styles:
+                    return speaker["speakerUuid"], styles[0]["styleId"]
+        return None, None
+
+    def resolve_speaker(self):
+        """Like find_speaker(), but served from the discovery cache if fresh."""
+        with TIMINGS.span("speaker_lookup"):
+            return self._resolve_speaker()
+
+    def _resolve_speaker(self):
+        cached = self.speakers.get(self.speaker_key) if self.speakers else None
+        if cached:
+            return cached["speakerUuid"], cached["styleId"]
+
+        speaker_uuid, style_id = self.find_speaker()
+        if speaker_uuid is not None and self.speakers:
+            self.speakers.put(
+                self.speaker_key, {"speakerUuid": speaker_uuid, "styleId": style_id}
+            )
+        return speaker_uuid, style_id
+
+    def synthesize(self, text, speaker_uuid, style_id, speed=None):
+        """Synthesize text and return the WAV bytes."""
+        # Step 1: Estimate prosody
+        prosody = json.loads(
+            api_request(
+                self.base_url, "/v1/estimate_prosody", {"text": text}, SYNTHESIS_TIMEOUT
+            )
+        )
+
+        # Step 2: Predict (generate WAV)
+        predict_body = {
+            "speakerUuid": speaker_uuid,
+            "styleId": style_id,
+            "text": text,
+            "prosodyDetail": prosody["detail"],
+            "speedScale": speed or self.speed,
+        }
+        return api_request(
+            self.base_url, "/v1/predict", predict_body, SYNTHESIS_TIMEOUT
+        )
+
+    def prepare(self, text, emotion=None):
+        """Synthesize text without playing it.
+
+        Returns (wav_path, is_temp), or None if no speaker was found.
+        """
+        speaker_uuid, style_id = self.resolve_speaker()
+        if speaker_uuid is None:
+            return None
+
+        key = WavCache.key(
+            "coeiroink", speaker_uuid, style_id, text, self.speed,
+            self.audio.signature if self.audio else None,
+        )
+        return fetch_wav(self.cache, key, lambda: render_wav(
+            self.audio,
+            lambda speed: (
+                self.synthesize(text, speaker_uuid, style_id, speed), speed or self.speed
+            ),
+            self.speed,
+        ))
+
+    def synthesize_and_play(self, text, emotion=None):
+        prepared = prepare_with_retry(self, text, emotion)
+        if prepared is None:
+            return False
+        play_prepared(prepared, text, emotion)
+        return True
+
+
+class VoicevoxAdapter:
+    """VOICEVOX API adapter."""
+
+    # Emotion → VOICEVOX style name mapping (common patterns)
+    EMOTION_STYLES = {
+        "Gentle": "ノーマル",
+        "Joy": "うれしい",
+        "Blush": "照れ",
+        "Trouble": "困り",
+        "Singing": "ノーマル",
+    }
+
+    def __init__(self, port=VOICEVOX_PORT, speaker_name=None, speed=1.0,
+                 cache=None, speakers=None, transport=None, base_url=None,
+                 audio=None):
+        self.base_url = base_url or f"http://localhost:{port}"
+        self.transport = get_transport(self.base_url, **(transport or {}))
+        self.speaker_name = speaker_name
+        self.speed = speed
+        self.cache = cache
+        self.audio = audio
+        self.speakers = speakers
+        self.speaker_key = f"voicevox|{self.base_url}|{speaker_name or ''}"
+
+    def is_available(self):
+        try:
+            api_request(self.base_url, "/speakers", retries=0)
+            return True
+        except Exception:
+            return False
+
+    def discover_styles(self):
+        """Scan /speakers once and map every emotion to a style ID.
+
+        Returns {"default", "normal", "emotions"} or None if no speaker
+        matched.
+        """
+        speakers = json.loads(api_request(self.base_url, "/speakers"))
+
+        for speaker in speakers:
+            name = speaker.get("name", "")
+            if self.speaker_name and self.speaker_name not in name:
+                continue
+
+            styles = speaker.get("styles", [])
+            if styles:
+                default = styles[0]["id"]
+
+                def match(target):
+                    for style in styles:
+                        if target in style.get("name", ""):
+                            return style["id"]
+                    return default
+
+                return {
+                    "default": default,
+                    "normal": match("ノーマル"),
+                    "emotions": {
+                        key: match(target)
+                        for key, target in self.EMOTION_STYLES.items()
+                    },
+                }
+
+            if not self.speaker_name:
+                break
+
+        return None
+
+    def find_speaker_id(self, emotion=None):
+        """Find speaker ID, optionally matching emotion to style."""
+        with TIMINGS.span("speaker_lookup"):
+            return self._find_speaker_id(emotion)
+
+    def _find_speaker_id(self, emotion=None):
+        styles = self.speakers.get(self.speaker_key) if self.speakers else None
+        if styles is None:
+            styles = self.discover_styles()
+            if styles is None:
+                return None
+            if self.speakers:
+                self.speakers.put(self.speaker_key, styles)
+
+        if not emotion:
+            return styles["default"]
+        return styles["emotions"].get(emotion, styles["normal"])
+
+    @staticmethod
+    def estimate_duration(query):
+        """Seconds of speech an audio query yields at speedScale 1, without
+        the pre/post phoneme silence."""
+        total = 0.0
+        for phrase in query.get("accent_phrases") or []:
+            moras = list(phrase.get("moras") or [])
+            if phrase.get("pause_mora"):
+                moras.append(phrase["pause_mora"])
+            for mora in moras:
+                total += (mora.get("consonant_length") or 0) + (mora.get("vowel_length") or 0)
+        return total
+
+    def synthesize(self, text, speaker_id, speed=None):
+        """Synthesize text. Returns (WAV bytes, speedScale sent).
+
+        With a max_duration set, the speedScale is raised up front from the
+        query's phoneme lengths instead of after a first synthesis.
+        """
+        from urllib.parse import quote
+
+        # Step 1: Audio query
+        query_url = (
+            f"/audio_query?text={quote(text)}&speaker={speaker_id}"
+        )
+        query = json.loads(
+            api_request(
+                self.base_url, query_url, timeout=SYNTHESIS_TIMEOUT, method="POST"
+            )
+        )
+        speed = speed or self.speed
+        if self.audio is not None:
+            pad = 2 * self.audio.pad_ms / 1000 if self.audio.threshold > 0 else 0.0
+            speed = self.audio.fit_speed(
+                self.estimate_duration(query) / speed + pad, speed
+            ) or speed
+        query["speedScale"] = speed
+
+        # Step 2: Synthesis
+        synth_url = f"/synthesis?speaker={speaker_id}"
+        return api_request(self.base_url, synth_url, query, SYNTHESIS_TIMEOUT), speed
+
+    def prepare(self, text, emotion=None):
+        """Synthesize text without playing it.
+
+        Returns (wav_path, is_temp), or None if no speaker was found.
+        """
+        speaker_id = self.find_speaker_id(emotion)
+        if speaker_id is None:
+            return None
+
+        key = WavCache.key(
+            "voicevox", speaker_id, text, self.speed,
+            self.audio.signature if self.audio else None,
+        )
+        return fetch_wav(self.cache, key, lambda: render_wav(
+            self.audio, lambda speed: self.synthesize(text, speaker_id, speed), self.speed
+        ))
+
+    def synthesize_and_play(self, text, emotion=None):
+        prepared = prepare_with_retry(self, text, emotion)
+        if prepared is None:
+            return False
+        play_prepared(prepared, text, emotion)
+        return True
+
+
+class NoneAdapter:
+    """No-audio adapter. Only writes signal file for mascot animation.
+
+    reason is set when standing in for an engine that can't be used right
+    now (e.g. "circuit_open"), so callers know to re-resolve later.
+    """
+
+    def __init__(self, reason=None):
+        self.reason = reason
+
+    def is_available(self):
+        return True
+
+    def synthesize_and_play(self, text, emotion=None):
+        import time
+
+        write_signal(text, emotion)
+        # Keep signal file for a brief moment so mascot can animate
+        time.sleep(1.0)
+        clear_signal()
+        return True
+
+
+# ── Streaming ─────────────────────────────────────────────────
+
+# A sentence runs up to Japanese/fullwidth terminators, or ASCII ones that
+# are followed by whitespace/end (so "3.5" or "v1.2" stay intact).
+_SENTENCE_RE = re.compile(r"(?:[^。．！？!?.\n]|[!?.](?=\S))+(?:[。．！？]+|[!?.]+)?")
+_CLAUSE_RE = re.compile(r"[^、，,]+[、，,]*")
+
+
+def split_sentences(text, max_chunk=MAX_MESSAGE_LENGTH):
+    """Split text into speakable chunks.
+
+    Splits at sentence boundaries first. Sentences longer than max_chunk
+    are split further at clause punctuation, and clauses are merged back
+    up to max_chunk so the engine isn't fed tiny fragments.
+    """
+    chunks = []
+    for sentence in _SENTENCE_RE.findall(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_chunk:
+            chunks.append(sentence)
+            continue
+
+        current = ""
+        for clause in _CLAUSE_RE.findall(sentence):
+            clause = clause.strip()
+            if current and len(current) + len(clause) > max_chunk:
+                chunks.append(current)
+                current = ""
+            current += clause
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def stream_and_play(adapter, text, emotion=None):
+    """Speak text chunk by chunk, synthesizing ahead of playback.
+
+    A worker thread prepares chunk N+1 while chunk N plays, so the time to
+    first audio only depends on the first chunk. The speaking signal stays
+    up across chunks so the mascot doesn't flicker between them. Returns
+    False if no speaker was found.
+    """
+    import queue
+
+    chunks = split_sentences(text)
+    if len(chunks) <= 1 or not hasattr(adapter, "prepare"):
+        return adapter.synthesize_and_play(text, emotion)
+
+    ready = queue.Queue(maxsize=STREAM_LOOKAHEAD)
+    stop = threading.Event()
+
+    def produce():
+        for chunk in chunks:
+            if stop.is_set():
+                return
+            try:
+                item = prepare_with_retry(adapter, chunk, emotion)
+            except Exception as e:
+                item = e
+            ready.put(item)
+            if item is None or isinstance(item, Exception):
+                return
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+
+    played = 0
+    try:
+        for _ in chunks:
+            item = ready.get()
+            if item is None:
+                return played > 0
+            if isinstance(item, Exception):
+                if played == 0:
+                    raise item
+                logging.warning("Streaming stopped after %d chunks: %s", played, item)
+                return True
+            # Rewrite the signal per chunk (it never disappears in between)
+            # so the envelope and start time match the audio being played
+            write_signal(text, emotion, load_envelope(item[0]))
+            try:
+                play_audio(item[0])
+            finally:
+                discard_prepared(item)
+            played += 1
+        return True
+    finally:
+        stop.set()
+        clear_signal()
+        # Unblock the worker and clean up anything it prepared ahead
+        while worker.is_alive() or not ready.empty():
+            try:
+                item = ready.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(item, tuple):
+                discard_prepared(item)
+
+
+# ── Utterance Queue ───────────────────────────────────────────
+
+
+def plan_queue(items, now, max_age, max_depth, coalesce=DEFAULT_QUEUE_COALESCE):
+    """Apply staleness, coalescing and depth limits to queued utterances.
+
+    items are oldest first. Utterances older than max_age are dropped. With
+    coalesce="replace" a newer utterance with the same emotion, signal
+    target and voice env replaces the queued one in place; "merge" appends
+    its message instead. Finally only the newest max_depth utterances are
+    kept.
+    """
+    planned = []
+    for item in items:
+        if now - item["time"] > max_age:
+            logging.info("Dropping stale utterance: %s", item["message"])
+            continue
+        same = None
+        if coalesce in ("replace", "merge"):
+            same = next(
+                (
+                    p
+                    for p in planned
+                    if p.get("emotion") == item.get("emotion")
+                    and p.get("signal_file") == item.get("signal_file")
+                    and (p.get("env") or {}) == (item.get("env") or {})
+                ),
+                None,
+            )
+        if same is None:
+            planned.append(dict(item))
+            continue
+        if coalesce == "merge":
+            same["message"] = f"{same['message']} {item['message']}"
+            same["stream"] = len(same["message"]) > MAX_MESSAGE_LENGTH
+        else:
+            same["message"] = item["message"]
+            same["stream"] = item.get("stream", False)
+        same["time"] = item["time"]
+
+    if len(planned) > max_depth:
+        logging.info("Queue full, dropping %d utterances", len(planned) - max_depth)
+        planned = planned[-max_depth:]
+    return planned
+
+
+class UtteranceQueue:
+    """File-spooled utterance queue drained by a single consumer.
+
+    Hooks drop one JSON file per utterance into the spool directory and
+    return immediately. The consumer holds an exclusive lock on the spool
+    while it drains, so playback is serialized and the engine only sees one
+    synthesis request at a time. In-process playback takes the same lock.
+    """
+
+    def __init__(self, directory, max_age=DEFAULT_QUEUE_MAX_AGE,
+                 max_depth=DEFAULT_QUEUE_MAX_DEPTH, coalesce=DEFAULT_QUEUE_COALESCE):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_depth = max_depth
+        self.coalesce = coalesce
+
+    @staticmethod
+    def supported():
+        try:
+            import fcntl  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def push(self, message, emotion=None, stream=False, signal_file=None, env=None):
+        item = {
+            "message": message,
+            "emotion": emotion,
+            "stream": stream,
+            "signal_file": signal_file,
+            "env": env or {},
+            "time": time.time(),
+        }
+        name = f"{time.time_ns()}-{os.getpid()}.json"
+        atomic_write(os.path.join(self.directory, name), json.dumps(item).encode())
+
+    def _spooled(self):
+        try:
+            return sorted(n for n in os.listdir(self.directory) if n.endswith(".json"))
+        except OSError:
+            return []
+
+    def has_items(self):
+        return bool(self._spooled())
+
+    def take(self):
+        """Remove and return all spooled utterances, oldest first."""
+        items = []
+        for name in self._spooled():
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    items.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return items
+
+    def acquire(self, blocking=True):
+        """Take the consumer/playback lock. Returns a handle, or None if busy."""
+        import fcntl
+
+        os.makedirs(self.directory, exist_ok=True)
+        handle = open(os.path.join(self.directory, ".lock"), "w")
+        try:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(handle, flags)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    @staticmethod
+    def release(handle):
+        handle.close()
+
+    def consumer_idle(self):
+        handle = self.acquire(blocking=False)
+        if handle is None:
+            return False
+        self.release(handle)
+        return True
+
+    def drain(self, dispatch):
+        """Speak queued utterances one at a time until the spool is empty.
+
+        Returns immediately if another consumer holds the lock.
+        """
+        while True:
+            handle = self.acquire(blocking=False)
+            if handle is None:
+                return
+            try:
+                pending = []
+                while True:
+                    pending = plan_queue(
+                        pending + self.take(),
+                        time.time(),
+                        self.max_age,
+                        self.max_depth,
+                        self.coalesce,
+                    )
+                    if not pending:
+                        break
+                    dispatch(pending.pop(0))
+            finally:
+                self.release(handle)
+            # An utterance pushed between the last take() and the unlock saw
+            # the lock held and did not start a consumer; pick it up here.
+            if not self.has_items():
+                return
+
+
+def make_queue(config):
+    """Build the utterance queue from config. Returns None where unsupported."""
+    if not UtteranceQueue.supported():
+        return None
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    return UtteranceQueue(
+        os.path.join(directory, "queue"),
+        max_age=float(config.get("queue_max_age", DEFAULT_QUEUE_MAX_AGE)),
+        max_depth=int(config.get("queue_max_depth", DEFAULT_QUEUE_MAX_DEPTH)),
+        coalesce=config.get("queue_coalesce", DEFAULT_QUEUE_COALESCE),
+    )
+
+
+# ── Engine Pool ───────────────────────────────────────────────
+
+
+class EnginePool:
+    """Load-balancing, failing-over front for several engine instances.
+
+    members are adapters with a tier: instances of the selected engine are
+    tier 0. Each synthesis goes to the member ranked best by (tier, circuit
+    open, failed recently, in-flight requests, no latency measured yet,
+    recent latency); if it raises, the next member is tried. fallback(), if given, builds further members (other engines,
+    tier 1 and up) the first time every member failed, so they cost nothing
+    while the selected engine is healthy.
+
+    In-flight requests are counted with marker files under
+    <cache_dir>/pool/ so concurrent hook processes (e.g. many swarm children
+    speaking at once) spread over the instances. Per-instance latency
+    (EWMA), request, error and busy-time counters live in pool.json there
+    and are reported by the stats subcommand.
+    """
+
+    def __init__(self, members, directory, fallback=None):
+        self.members = []
+        self.directory = directory
+        self.fallback = fallback
+        self.stats = TTLStore(os.path.join(directory, "pool.json"), POOL_STATS_TTL)
+        self.speakers = None  # discovery retries happen per member
+        self.cache = next((m.cache for m, _ in members), None)
+        self.engine = member_engine(members[0][0])
+        self.instance = None
+        self.failures = {}  # failed syntheses per member id
+        self._add(members)
+
+    def _add(self, members):
+        for member, tier in members:
+            member.synthesize = self._tracked(member, member.synthesize)
+            self.members.append((member, tier))
+
+    def _marker_prefix(self, member):
+        return WavCache.key(member.base_url)[:16] + "-"
+
+    def in_flight(self, member):
+        """Count live in-flight markers for member across processes."""
+        prefix = self._marker_prefix(member)
+        stale = time.time() - 2 * SYNTHESIS_TIMEOUT
+        count = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.startswith(prefix):
+                        continue
+                    try:
+                        if entry.stat().st_mtime < stale:
+                            os.unlink(entry.path)  # left by a killed process
+                            continue
+                    except OSError:
+                        continue
+                    count += 1
+        except OSError:
+            pass
+        return count
+
+    def _tracked(self, member, synthesize):
+        """Wrap member.synthesize() to maintain in-flight and latency stats.
+
+        Only real engine calls are tracked; WAV cache hits never get here.
+        """
+        def run(*args):
+            os.makedirs(self.directory, exist_ok=True)
+            marker = os.path.join(
+                self.directory,
+                f"{self._marker_prefix(member)}{os.getpid()}-{time.time_ns()}",
+            )
+            open(marker, "w").close()
+            start = time.monotonic()
+            ok = False
+            try:
+                result = synthesize(*args)
+                ok = True
+                return result
+            finally:
+                with contextlib.suppress(OSError):
+                    os.unlink(marker)
+                if not ok:
+                    self.failures[id(member)] = self.failures.get(id(member), 0) + 1
+                self._record(member, (time.monotonic() - start) * 1000, ok)
+
+        return run
+
+    def _record(self, member, ms, ok):
+        """Count a request to member; ms is None if it never reached synthesis."""
+        def update(data):
+            data = data or {"since": time.time()}
+            latency = data.get("latency_ms")
+            if ok:
+                latency = ms if latency is None else (
+                    POOL_LATENCY_ALPHA * ms + (1 - POOL_LATENCY_ALPHA) * latency
+                )
+            return {
+                "engine": member_engine(member),
+                "latency_ms": round(latency, 1) if latency is not None else None,
+                "requests": data.get("requests", 0) + 1,
+                "errors": data.get("errors", 0) + (not ok),
+                "error_at": None if ok else time.time(),
+                "busy_ms": round(data.get("busy_ms", 0) + (ms or 0), 1),
+                "since": data["since"],
+            }
+
+        self.stats.update(member.base_url, update)
+
+    def ranked(self):
+        """Members best first.
+
+        An instance that failed recently ranks after every healthy one; one
+        not measured yet ranks after measured ones with as many requests in
+        flight, so it is still tried when those are busy.
+        """
+        import random
+
+        now = time.time()
+
+        def score(pair):
+            member, tier = pair
+            transport = getattr(member, "transport", None)
+            data = self.stats.get(member.base_url) or {}
+            latency = data.get("latency_ms")
+            return (
+                tier,
+                transport is not None and transport.is_open(),
+                now - (data.get("error_at") or 0) < POOL_ERROR_BACKOFF,
+                self.in_flight(member),
+                latency is None,
+                latency or 0.0,
+                random.random(),
+            )
+
+        return [member for member, _ in sorted(self.members, key=score)]
+
+    def is_available(self):
+        return any(member.is_available() for member, _ in self.members)
+
+    def prepare(self, text, emotion=None):
+        """Prepare on the best member, failing over to the next on errors.
+
+        Returns (wav_path, is_temp), or None if no member found a speaker.
+        Re-raises the last error when every member failed.
+        """
+        error = None
+        tried = set()
+        while True:
+            for member in self.ranked():
+                if id(member) in tried:
+                    continue
+                tried.add(id(member))
+                failures = self.failures.get(id(member), 0)
+                try:
+                    prepared = prepare_with_retry(member, text, emotion)
+                except Exception as e:
+                    if self.failures.get(id(member), 0) == failures:
+                        # Failed before synthesis (e.g. speaker discovery)
+                        self._record(member, None, False)
+                    logging.warning(
+                        "Engine %s failed, failing over: %s", member.base_url, e
+                    )
+                    error = e
+                    continue
+                if prepared is not None:
+                    self.engine = member_engine(member)
+                    self.instance = member.base_url
+                    return prepared
+            if error is None or self.fallback is None:
+                break
+            fallback, self.fallback = self.fallback, None
+            self._add(fallback())
+        if error is not None:
+            raise error
+        return None
+
+    def synthesize_and_play(self, text, emotion=None):
+        prepared = self.prepare(text, emotion)
+        if prepared is None:
+            return False
+        play_prepared(prepared, text, emotion)
+        return True
+
+
+def member_engine(adapter):
+    """Engine name of an adapter: the engine that served the last request
+    for a pool, else from its class (CoeiroinkAdapter -> coeiroink)."""
+    return getattr(adapter, "engine", None) or type(adapter).__name__.replace(
+        "Adapter", ""
+    ).lower()
+
+
+def pool_stats(config):
+    """Per-instance utilization from pool.json (requests, errors, latency)."""
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    store = TTLStore(os.path.join(directory, "pool", "pool.json"), POOL_STATS_TTL)
+    entries = store.items()
+    total = sum(data.get("requests", 0) for data in entries.values()) or 1
+    now = time.time()
+    report = {}
+    for url, data in sorted(entries.items()):
+        window = max(now - data.get("since", now), 1.0)
+        report[url] = {
+            **data,
+            "share": round(data.get("requests", 0) / total, 3),
+            # Average concurrent syntheses since first seen (> 1: overlapping)
+            "avg_in_flight": round(data.get("busy_ms", 0) / 1000 / window, 3),
+        }
+    return report
+
+
+# ── Engine Resolution ─────────────────────────────────────────
+
+
+def make_wav_cache(config):
+    """Build the WAV cache from config. Returns None when disabled."""
+    max_mb = float(config.get("cache_max_mb", DEFAULT_CACHE_MAX_MB))
+    if max_mb <= 0:
+        return None
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    return WavCache(os.path.join(directory, "wav"), int(max_mb * (1 << 20)))
+
+
+def make_speaker_cache(config):
+    """Build the speaker discovery cache from config. Returns None when disabled."""
+    ttl = float(config.get("speaker_cache_ttl", DEFAULT_SPEAKER_CACHE_TTL))
+    if ttl <= 0:
+        return None
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    return TTLStore(os.path.join(directory, "speakers.json"), ttl)
+
+
+def make_detection_cache(config):
+    """Build the engine auto-detection cache from config. Returns None when disabled."""
+    ttl = float(config.get("detect_cache_ttl", DEFAULT_DETECT_CACHE_TTL))
+    if ttl <= 0:
+        return None
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    return TTLStore(os.path.join(directory, "engine.json"), ttl)
+
+
+def make_breaker_store(config):
+    """Build the shared circuit breaker state from config. Returns None when disabled."""
+    cooldown = float(config.get("breaker_cooldown", DEFAULT_BREAKER_COOLDOWN))
+    if cooldown <= 0:
+        return None
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    return TTLStore(os.path.join(directory, "breaker.json"), cooldown)
+
+
+def make_audio_processor(config):
+    """Build WAV post-processing from config. Returns None when all of it is off."""
+    audio = AudioProcessor(
+        threshold=float(config.get("silence_threshold", DEFAULT_SILENCE_THRESHOLD)),
+        pad_ms=float(config.get("silence_pad_ms", DEFAULT_SILENCE_PAD_MS)),
+        max_duration=float(config.get("max_duration", 0)),
+        rate=int(config.get("audio_rate", 0)),
+        mono=config.get("audio_mono") == "true",
+    )
+    if audio.threshold <= 0 and not (audio.max_duration or audio.rate or audio.mono):
+        return None
+    return audio
+
+
+def adapter_options(config):
+    """Common adapter keyword arguments from env/config."""
+    return {
+        "speaker_name": os.environ.get("TTS_SPEAKER") or config.get("speaker_name"),
+        "speed": float(config.get("speed_scale", 1.0)),
+        "cache": make_wav_cache(config),
+        "speakers": make_speaker_cache(config),
+        "audio": make_audio_processor(config),
+        "transport": {
+            "breaker": make_breaker_store(config),
+            "threshold": int(config.get("breaker_threshold", DEFAULT_BREAKER_THRESHOLD)),
+            "retries": int(config.get("http_retries", DEFAULT_HTTP_RETRIES)),
+        },
+    }
+
+
+def engine_endpoints(engine, config, default_port):
+    """Base URLs for an engine's instances.
+
+    <engine>_endpoints lists instances as ports, host:port or URLs
+    ("50021, 50121, http://gpu-box:50021"); otherwise the single
+    <engine>_port on localhost is used.
+    """
+    endpoints = []
+    for item in config.get(f"{engine}_endpoints", "").split(","):
+        item = item.strip().rstrip("/")
+        if not item:
+            continue
+        if "://" not in item:
+            item = f"http://{item}" if ":" in item else f"http://localhost:{item}"
+        endpoints.append(item)
+    if not endpoints:
+        port = int(config.get(f"{engine}_port", default_port))
+        endpoints.append(f"http://localhost:{port}")
+    return endpoints
+
+
+def make_coeiroink(config, base_url=None):
+    port = int(config.get("coeiroink_port", COEIROINK_PORT))
+    return CoeiroinkAdapter(port=port, base_url=base_url, **adapter_options(config))
+
+
+def make_voicevox(config, base_url=None):
+    port = int(config.get("voicevox_port", VOICEVOX_PORT))
+    return VoicevoxAdapter(port=port, base_url=base_url, **adapter_options(config))
+
+
+# Default ports of the built-in engines that take <engine>_endpoints lists
+ENGINE_PORTS = {"coeiroink": COEIROINK_PORT, "voicevox": VOICEVOX_PORT}
+
+
+# Engine name -> factory(config) returning an adapter. A factory may also be
+# given as "module:attr", imported only when that engine is selected, so
+# extra engines cost nothing at start-up. Third-party engines can be added
+# from tts_config.toml with: adapter.NAME = "module:factory"
+ADAPTERS = {
+    "coeiroink": make_coeiroink,
+    "voicevox": make_voicevox,
+    "none": lambda config: NoneAdapter(),
+}
+
+
+def register_adapter(name, factory):
+    """Register factory(config) (or a "module:attr" path) for an engine name."""
+    ADAPTERS[name] = factory
+
+
+def adapter_factory(engine, config):
+    """Return the factory for an engine, importing it on first use."""
+    factory = ADAPTERS.get(engine) or config.get(f"adapter.{engine}")
+    if factory is None:
+        raise ValueError(f"Unknown TTS engine: {engine}")
+    if isinstance(factory, str):
+        import importlib
+
+        module_name, _, attr = factory.partition(":")
+        with TIMINGS.span(f"import {module_name}"):
+            factory = getattr(importlib.import_module(module_name), attr)
+        ADAPTERS[engine] = factory
+    return factory
+
+
+def make_instances(engine, config):
+    """Build one adapter per configured instance of an engine."""
+    factory = adapter_factory(engine, config)
+    if engine not in ENGINE_PORTS:
+        return [factory(config)]
+    return [
+        factory(config, url)
+        for url in engine_endpoints(engine, config, ENGINE_PORTS[engine])
+    ]
+
+
+def make_pool(engine, config, fallback_engines=()):
+    """Adapter for an engine: the adapter itself if only one instance is
+    configured and there is nothing to fail over to, an EnginePool otherwise.
+
+    fallback_engines are only built once every instance of engine failed.
+    """
+    members = [(adapter, 0) for adapter in make_instances(engine, config)]
+    if len(members) == 1 and not fallback_engines:
+        return members[0][0]
+
+    fallback = None
+    if fallback_engines:
+        def fallback():
+            return [
+                (adapter, tier)
+                for tier, name in enumerate(fallback_engines, 1)
+                for adapter in make_instances(name, config)
+            ]
+
+    directory = os.path.expanduser(config.get("cache_dir", CACHE_DIR))
+    return EnginePool(members, os.path.join(directory, "pool"), fallback)
+
+
+def make_adapter(engine, config):
+    """Build the adapter for an engine name with options from env/config."""
+    return make_pool(engine, config)
+
+
+def probe_engines(config):
+    """Probe engines concurrently and return the best available engine name.
+
+    Engines are checked in engine_priority order; a lower-priority engine
+    only wins once every engine ahead of it has answered unavailable.
+    Returns "none" when nothing responds.
+    """
+    priority = config.get("engine_priority", DEFAULT_ENGINE_PRIORITY)
+    engines = [e.strip() for e in priority.split(",") if e.strip()]
+
+    probes = []
+    for engine in engines:
+        adapter = make_adapter(engine, config)
+        box = []
+        thread = threading.Thread(
+            target=lambda a=adapter, b=box: b.append(a.is_available()),
+            daemon=True,
+        )
+        thread.start()
+        probes.append((engine, thread, box))
+
+    for engine, thread, box in probes:
+        thread.join(HOOK_TIMEOUT + 1)
+        if box and box[0]:
+            return engine
+    return "none"
+
+
+def spawn_detached(*args):
+    """Run the hook script with args in a detached background process."""
+    import subprocess
+
+    try:
+        subprocess.Popen(
+            [sys.executable, HOOK_SCRIPT, *args],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        return True
+    except OSError as e:
+        logging.warning("Failed to start background %s: %s", " ".join(args), e)
+        return False
+
+
+def spawn_engine_probe():
+    """Re-run engine detection in a detached process (off the hot path)."""
+    spawn_detached("--probe-engines")
+
+
+def detect_engine(config):
+    """Auto-detect the engine, using the cached result when available.
+
+    A fresh cached result is used as is. A stale one is still used, while
+    a background probe refreshes it for the next call. Only a missing entry
+    makes us probe on the hot path.
+    """
+    store = make_detection_cache(config)
+    if store is None:
+        return probe_engines(config)
+
+    data, fresh = store.get_entry("auto")
+    if data is not None:
+        if not fresh:
+            # Re-stamp the stale result so concurrent hooks don't all spawn
+            # probes; the background probe overwrites it shortly.
+            store.put("auto", data)
+            spawn_engine_probe()
+        return data["engine"]
+
+    engine = probe_engines(config)
+    store.put("auto", {"engine": engine})
+    return engine
+
+
+def forget_detected_engine(config):
+    """Drop the cached auto-detection result (e.g. after the engine failed)."""
+    store = make_detection_cache(config)
+    if store is not None:
+        store.invalidate("auto")
+
+
+def resolve_adapter(config):
+    """Resolve TTS adapter from env, config, or auto-detect.
+
+    An engine whose circuit breaker is open is replaced by a NoneAdapter
+    straight away instead of waiting on it to fail again, unless it has
+    other engines to fail over to.
+    """
+    engine = os.environ.get("TTS_ENGINE") or config.get("engine")
+    fallback_engines = []
+    if not engine:
+        engine = detect_engine(config)
+        if engine == "none":
+            logging.info("No TTS engine available, using signal-only mode")
+        else:
+            logging.info("Auto-detected %s", engine)
+        # With engine_failover, an auto-detected engine fails over to the
+        # others in priority order; a pinned engine keeps its voice.
+        if engine != "none" and config.get("engine_failover") == "true":
+            priority = config.get("engine_priority", DEFAULT_ENGINE_PRIORITY)
+            fallback_engines = [
+                e.strip() for e in priority.split(",")
+                if e.strip() and e.strip() != engine
+            ]
+
+    adapter = make_pool(engine, config, fallback_engines)
+    if getattr(adapter, "fallback", None) is not None:
+        return adapter
+    members = [m for m, _ in adapter.members] if isinstance(adapter, EnginePool) else [adapter]
+    transports = [getattr(m, "transport", None) for m in members]
+    if all(t is not None and t.is_open() for t in transports):
+        logging.info("Circuit open for %s, using signal-only mode", engine)
+        return NoneAdapter(reason="circuit_open")
+    return adapter
+
+
+# ── Dispatch ──────────────────────────────────────────────────
+
+
+def speak(resolve, message, emotion=None, stream=False, signal_file=None):
+    """Speak a message via the adapter returned by resolve().
+
+    With stream=True, long messages are synthesized and played sentence by
+    sentence. signal_file overrides the speaking signal target. Returns the
+    result dict printed by the hook.
+    """
+    result = {"status": "unknown"}
+
+    with signal_route(signal_file):
+        try:
+            with TIMINGS.span("resolve"):
+                adapter = resolve()
+            engine_name = member_engine(adapter)
+
+            if isinstance(adapter, NoneAdapter):
+                adapter.synthesize_and_play(message, emotion)
+                notify_osascript(message)
+                result = {
+                    "status": "fallback",
+                    "engine": "none",
+                    "message": message,
+                }
+                if adapter.reason:
+                    result["reason"] = adapter.reason
+            else:
+                if stream:
+                    success = stream_and_play(adapter, message, emotion)
+                else:
+                    success = adapter.synthesize_and_play(message, emotion)
+                engine_name = member_engine(adapter)
+                if success:
+                    result = {
+                        "status": "tts",
+                        "engine": engine_name,
+                        "message": message,
+                    }
+                    if emotion:
+                        result["emotion"] = emotion
+                    if getattr(adapter, "instance", None):
+                        result["instance"] = adapter.instance
+                    logging.info("TTS playback complete via %s", engine_name)
+                else:
+                    notify_osascript(message)
+                    result = {
+                        "status": "fallback",
+                        "reason": "speaker_not_found",
+                        "engine": engine_name,
+                        "message": message,
+                    }
+                    logging.warning("Speaker not found in %s", engine_name)
+        except Exception as e:
+            logging.error("TTS failed: %s", e)
+            try:
+                notify_osascript(message)
+            except Exception:
+                pass
+            result = {"status": "error", "error": str(e), "message": message}
+
+    return result
+
+
+# ── Daemon ────────────────────────────────────────────────────
+
+
+class TTSDaemon:
+    """Resident dispatcher that keeps config and adapters in memory.
+
+    Requests carry the client's CLIENT_ENV variables, so a hook run with
+    TTS_ENGINE/TTS_SPEAKER gets the voice it would get in-process; one
+    adapter is kept per distinct engine/speaker. Requests without an env
+    (older clients) use the daemon's own environment.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.env = client_env()
+        # Every request picks its voice from its own env (via env_config),
+        # so the daemon's variables must not leak into resolve_adapter()
+        for name in CLIENT_ENV:
+            os.environ.pop(name, None)
+        self.adapters = {}
+        self.pending = None  # queue.Queue of accepted requests while serving
+
+    def request_config(self, request):
+        env = request.get("env")
+        return env_config(self.config, self.env if env is None else env)
+
+    def get_adapter(self, config):
+        key = tuple(config.get(key) for key in CLIENT_ENV.values())
+        if key not in self.adapters:
+            self.adapters[key] = resolve_adapter(config)
+        return self.adapters[key]
+
+    def handle(self, request):
+        message = request.get("message") or DEFAULT_MESSAGE
+        emotion = request.get("emotion")
+        stream = bool(request.get("stream"))
+        signal_file = request.get("signal_file")
+        config = self.request_config(request)
+        logging.info("TTS fired: message=%s emotion=%s", message, emotion)
+
+        TIMINGS.reset()
+        with TIMINGS.span("total"):
+            result = speak(
+                lambda: self.get_adapter(config), message, emotion, stream, signal_file
+            )
+        result["timings"] = TIMINGS.as_dict()
+        record_metrics(self.config, result)
+
+        # Re-resolve on the next request after an error, or when we fell
+        # back to signal-only mode by auto-detection or an open circuit (the
+        # engine may have been started or recovered since).
+        auto_none = result.get("engine") == "none" and (
+            result.get("reason") == "circuit_open" or not config.get("engine")
+        )
+        if result["status"] == "error":
+            forget_detected_engine(config)
+        if result["status"] == "error" or auto_none:
+            self.adapters.clear()
+        return result
+
+    def serve(self, path=DAEMON_SOCKET):
+        """Accept requests on a Unix socket until interrupted.
+
+        Requests are spoken by a single worker thread in arrival order.
+        Hooks get {"status": "accepted"} as soon as their request is read,
+        so they never wait on playback (long --stream messages, or others
+        queued ahead of them); the outcome goes to the log and metrics.
+        Requests with "wait" (from the utterance queue's consumer) are
+        answered with the result once spoken, so the consumer hands over
+        one utterance at a time and the queue's staleness, coalescing and
+        depth limits keep applying to the rest.
+        """
+        import queue
+        import signal
+        import socket
+
+        if os.path.exists(path):
+            if request_daemon({"ping": True}, path) is not None:
+                raise RuntimeError(f"Daemon already running on {path}")
+            os.unlink(path)
+
+        preload_numpy()
+        self.pending = queue.Queue()
+        threading.Thread(target=self._work, daemon=True).start()
+        # Exit through the finally block below so the socket file is removed
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(path)
+            os.chmod(path, 0o600)
+            server.listen(8)
+            logging.info("TTS daemon listening on %s", path)
+            while True:
+                conn, _ = server.accept()
+                self._handle_connection(conn)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            logging.info("TTS daemon stopped")
+
+    def _work(self):
+        while True:
+            request, conn = self.pending.get()
+            try:
+                result = self.handle(request)
+            except Exception as e:
+                logging.exception("TTS daemon request failed")
+                result = {
+                    "status": "error",
+                    "error": str(e),
+                    "message": request.get("message"),
+                }
+            if conn is not None:
+                self._reply(conn, result)
+
+    @staticmethod
+    def _reply(conn, result):
+        try:
+            conn.sendall(json.dumps(result).encode() + b"\n")
+        except OSError as e:
+            logging.warning("TTS daemon connection failed: %s", e)
+        finally:
+            conn.close()
+
+    def _handle_connection(self, conn):
+        """Read one request; the connection is closed once it is answered."""
+        try:
+            with conn.makefile("rb") as f:
+                line = f.readline()
+        except OSError as e:
+            logging.warning("TTS daemon connection failed: %s", e)
+            conn.close()
+            return
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = {}
+
+        if request.get("ping"):
+            self._reply(conn, {"status": "ok"})
+        elif request.get("wait"):
+            self.pending.put((request, conn))  # the worker replies
+        else:
+            self.pending.put((request, None))
+            result = {
+                "status": "accepted",
+                "message": request.get("message") or DEFAULT_MESSAGE,
+            }
+            if request.get("emotion"):
+                result["emotion"] = request["emotion"]
+            self._reply(conn, result)
+
+
+def request_daemon(request, path=DAEMON_SOCKET):
+    """Send a request to a running daemon.
+
+    Returns the daemon's reply, or None if no daemon is reachable. That is
+    {"status": "accepted"} once it has queued the message, or with
+    request["wait"] the result after the message was spoken.
+    """
+    if not os.path.exists(path):
+        return None
+    import socket
+
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    # Once connected the daemon owns the request; don't fall back and risk
+    # speaking the message twice.
+    try:
+        timeout = DAEMON_WAIT_TIMEOUT if request.get("wait") else DAEMON_ACCEPT_TIMEOUT
+        sock.settimeout(timeout)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+        return json.loads(line)
+    except (OSError, ValueError) as e:
+        return {
+            "status": "error",
+            "error": f"daemon: {e}",
+            "message": request.get("message"),
+        }
+    finally:
+        sock.close()
+
+
+# ── Prewarm ───────────────────────────────────────────────────
+
+
+def find_emotions_file(config):
+    """Locate emotions.toml from config or next to the checkout."""
+    if config.get("emotions_file"):
+        return os.path.expanduser(config["emotions_file"])
+    base = os.path.dirname(os.path.realpath(__file__))
+    for candidate in EMOTIONS_FILE_CANDIDATES:
+        path = os.path.normpath(os.path.join(base, candidate))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_emotion_phrases(path):
+    """Read (emotion, phrase) pairs from emotions.toml.
+
+    Uses each emotion's phrases list, or the comma-separated usage field
+    for emotions without phrases. Only handles the subset of TOML that
+    emotions.toml uses (sections, strings and string arrays).
+    """
+    sections = {}
+    current = None
+    array_key = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if array_key:
+                if line.startswith("]"):
+                    array_key = None
+                elif line.startswith('"'):
+                    current[array_key].append(line.rstrip(",").strip().strip('"'))
+                continue
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("["):
+                name = line.strip("[]").strip()
+                current = sections.setdefault(name, {}) if "." not in name else None
+                continue
+            if current is None or "=" not in line:
+                continue
+            key, val = (part.strip() for part in line.split("=", 1))
+            if val == "[":
+                current[key] = []
+                array_key = key
+            elif val.startswith('"'):
+                current[key] = val.split('"')[1]
+
+    pairs = []
+    for emotion, fields in sections.items():
+        phrases = fields.get("phrases")
+        if not phrases and "usage" in fields:
+            phrases = [p.strip() for p in fields["usage"].split(",") if p.strip()]
+        for phrase in phrases or []:
+            pairs.append((emotion, phrase))
+    return pairs
+
+
+def load_phrase_file(path):
+    """Read (emotion, phrase) pairs from a text file.
+
+    One phrase per line, optionally prefixed with "Emotion<TAB>". Blank
+    lines and # comments are skipped.
+    """
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            emotion, _, phrase = line.rpartition("\t")
+            pairs.append((emotion.strip() or None, phrase.strip()))
+    return pairs
+
+
+def prewarm(adapter, pairs, workers=DEFAULT_PREWARM_WORKERS):
+    """Synthesize (emotion, phrase) pairs into the WAV cache without playback.
+
+    Returns a report with throughput and failures.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Match the keys the hook will use: same truncation, no duplicates
+    pairs = list(dict.fromkeys((e, p[:MAX_MESSAGE_LENGTH]) for e, p in pairs))
+
+    def warm(pair):
+        emotion, phrase = pair
+        prepared = prepare_with_retry(adapter, phrase, emotion)
+        if prepared is None:
+            raise RuntimeError("speaker not found")
+        discard_prepared(prepared)
+
+    failures = []
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [(pair, pool.submit(warm, pair)) for pair in pairs]
+        for (emotion, phrase), future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logging.warning("Prewarm failed for %s: %s", phrase, e)
+                failures.append({"message": phrase, "emotion": emotion, "error": str(e)})
+    elapsed = time.monotonic() - start
+
+    warmed = len(pairs) - len(failures)
+    return {
+        "total": len(pairs),
+        "warmed": warmed,
+        "failed": len(failures),
+        "seconds": round(elapsed, 3),
+        "per_second": round(warmed / elapsed, 2) if elapsed > 0 else None,
+        "failures": failures,
+    }
+
+
+def prewarm_main(argv, config):
+    """Entry point for: mascot_tts.py prewarm [--phrases FILE] [--workers N]"""
+    phrase_file = None
+    workers = int(config.get("prewarm_workers", DEFAULT_PREWARM_WORKERS))
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--phrases" and i + 1 < len(argv):
+            phrase_file = argv[i + 1]
+        elif argv[i] == "--workers" and i + 1 < len(argv):
+            workers = int(argv[i + 1])
+        else:
+            print(json.dumps({"status": "error", "error": f"unknown argument: {argv[i]}"}))
+            return
+        i += 2
+
+    if phrase_file:
+        pairs = load_phrase_file(phrase_file)
+    else:
+        emotions_file = find_emotions_file(config)
+        pairs = load_emotion_phrases(emotions_file) if emotions_file else []
+        pairs.append((None, DEFAULT_MESSAGE))
+
+    adapter = resolve_adapter(config)
+    engine_name = member_engine(adapter)
+    if not hasattr(adapter, "prepare"):
+        print(json.dumps({"status": "error", "error": "no TTS engine available"}))
+        return
+    if adapter.cache is None:
+        logging.warning("Prewarm with the WAV cache disabled has no lasting effect")
+
+    preload_numpy()
+    report = prewarm(adapter, pairs, workers)
+    report = {"status": "prewarmed", "engine": engine_name, **report}
+    logging.info(
+        "Prewarmed %d/%d phrases via %s in %.2fs",
+        report["warmed"], report["total"], engine_name, report["seconds"],
+    )
+    print(json.dumps(report, ensure_ascii=False))
+
+
+# ── Main ──────────────────────────────────────────────────────
+
+
+def parse_args(argv):
+    """Split leading option flags from message words.
+
+    Returns (options, words). Flags are only recognized before the first
+    message word, so messages may contain anything.
+    """
+    options = {
+        "emotion": None,
+        "serve": False,
+        "refresh_speakers": False,
+        "probe_engines": False,
+        "stream": False,
+        "enqueue": False,
+        "drain_queue": False,
+        "signal_dir": None,
+        "task_id": None,
+    }
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--emotion" and i + 1 < len(argv):
+            options["emotion"] = argv[i + 1]
+            i += 2
+        elif arg == "--serve":
+            options["serve"] = True
+            i += 1
+        elif arg == "--refresh-speakers":
+            options["refresh_speakers"] = True
+            i += 1
+        elif arg == "--stream":
+            options["stream"] = True
+            i += 1
+        elif arg == "--enqueue":
+            options["enqueue"] = True
+            i += 1
+        elif arg == "--drain-queue":
+            options["drain_queue"] = True
+            i += 1
+        elif arg == "--signal-dir" and i + 1 < len(argv):
+            options["signal_dir"] = argv[i + 1]
+            i += 2
+        elif arg == "--task-id" and i + 1 < len(argv):
+            options["task_id"] = argv[i + 1]
+            i += 2
+        elif arg == "--probe-engines":
+            options["probe_engines"] = True
+            i += 1
+        else:
+            break
+    return options, argv[i:]
+
+
+def stats_main(argv, config):
+    """Entry point for: mascot_tts.py stats [--last N]"""
+    last = None
+    if len(argv) >= 2 and argv[0] == "--last":
+        last = int(argv[1])
+    report = metrics_stats(last)
+    instances = pool_stats(config)
+    if instances:
+        report["instances"] = instances
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    start = time.monotonic()
+    setup_logging()
+
+    argv = sys.argv[1:]
+    with TIMINGS.span("config"):
+        config = load_config()
+    if argv and argv[0] == "prewarm":
+        prewarm_main(argv[1:], config)
+        return
+    if argv and argv[0] == "stats":
+        stats_main(argv[1:], config)
+        return
+
+    options, argv = parse_args(argv)
+    emotion = options["emotion"]
+
+    if options["refresh_speakers"]:
+        speakers = make_speaker_cache(config)
+        if speakers:
+            speakers.invalidate()
+        logging.info("Speaker cache cleared")
+        if not argv:
+            print(json.dumps({"status": "refreshed"}))
+            return
+
+    if options["probe_engines"]:
+        engine = probe_engines(config)
+        store = make_detection_cache(config)
+        if store is not None:
+            store.put("auto", {"engine": engine})
+        logging.info("Engine probe: %s", engine)
+        print(json.dumps({"status": "probed", "engine": engine}))
+        return
+
+    if options["serve"]:
+        setup_logging(resident=True)
+        TTSDaemon(config).serve()
+        return
+
+    if options["drain_queue"]:
+        utterances = make_queue(config)
+        if utterances is not None:
+            dispatcher = TTSDaemon(config)
+            utterances.drain(
+                lambda item: request_daemon({**item, "wait": True})
+                or dispatcher.handle(item)
+            )
+        return
+
+    try:
+        hook_input = json.load(sys.stdin)
+    except (json.JSONDecodeError, EOFError):
+        hook_input = {}
+
+    # Custom message from argv, stdin JSON, or default
+    if argv:
+        message = " ".join(argv)
+    else:
+        message = hook_input.get("message", DEFAULT_MESSAGE)
+    stream = options["stream"] or config.get("stream") == "true"
+    message = message[: MAX_STREAM_LENGTH if stream else MAX_MESSAGE_LENGTH]
+    signal_file = None
+    if options["signal_dir"] or options["task_id"]:
+        signal_file = signal_path(options["signal_dir"], options["task_id"])
+
+    utterances = make_queue(config)
+    enqueue = options["enqueue"] or config.get("enqueue") == "true"
+    if enqueue and utterances is not None:
+        utterances.push(message, emotion, stream, signal_file, client_env())
+        if utterances.consumer_idle():
+            spawn_detached("--drain-queue")
+        result = {"status": "queued", "message": message}
+        if emotion:
+            result["emotion"] = emotion
+        print(json.dumps(result))
+        return
+
+    result = request_daemon(
+        {
+            "message": message,
+            "emotion": emotion,
+            "stream": stream,
+            "signal_file": signal_file,
+            "env": client_env(),
+        }
+    )
+    if result is None:
+        logging.info("TTS fired: message=%s emotion=%s", message, emotion)
+        # Wait for any queue consumer so we don't talk over it
+        with TIMINGS.span("queue_wait"):
+            lock = utterances.acquire() if utterances is not None else None
+        try:
+            result = speak(
+                lambda: resolve_adapter(config), message, emotion, stream, signal_file
+            )
+        finally:
+            if lock is not None:
+                utterances.release(lock)
+                # An --enqueue that arrived while we held the lock saw it
+                # taken and did not start a consumer; start one for it.
+                if utterances.has_items():
+                    spawn_detached("--drain-queue")
+        if result["status"] == "error":
+            forget_detected_engine(config)
+        TIMINGS.add("total", time.monotonic() - start)
+        result["timings"] = TIMINGS.as_dict()
+        record_metrics(config, result)
+
+    print(json.dumps(result))
+
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Tests for mascot_tts.py against the benchmark's mock engine.
+
+Run with: make test-tts  (or python3 -m unittest hooks/test_mascot_tts.py)
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+HOOKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOOKS_DIR)
+
+import mascot_tts_core  # noqa: E402
+from bench_mascot_tts import MockEngine, make_wav  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class MascotTTSTestCase(unittest.TestCase):
+    """Sandboxes signal files, player and caches under a temp dir."""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="mascot_tts_test_")
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        for name, value in {
+            "SIGNAL_FILE": os.path.join(self.workdir, "mascot_speaking"),
+            "EVENT_JOURNAL": os.path.join(self.workdir, "mascot_events.jsonl"),
+            "play_audio": lambda wav_path: None,
+            "notify_osascript": lambda message: None,
+            "TRANSPORTS": {},
+        }.items():
+            patcher = mock.patch.object(mascot_tts_core, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in mascot_tts_core.CLIENT_ENV:
+            os.environ.pop(name, None)
+
+    def start_engine(self, **kwargs):
+        engine = MockEngine(**kwargs).start()
+        self.addCleanup(engine.stop)
+        return engine
+
+
+class CircuitBreakerTest(MascotTTSTestCase):
+    def test_recovered_engine_closes_circuit_after_cooldown(self):
+        port = free_port()
+        config = {
+            "engine": "voicevox",
+            "voicevox_port": str(port),
+            "cache_dir": self.workdir,
+            "cache_max_mb": "0",
+            "breaker_threshold": "3",
+            "breaker_cooldown": "0.5",
+        }
+
+        # Nothing listens yet: three failed utterances open the circuit
+        for _ in range(3):
+            adapter = mascot_tts_core.resolve_adapter(config)
+            with self.assertRaises(OSError):
+                adapter.synthesize_and_play("テスト", "Joy")
+        adapter = mascot_tts_core.resolve_adapter(config)
+        self.assertIsInstance(adapter, mascot_tts_core.NoneAdapter)
+        self.assertEqual(adapter.reason, "circuit_open")
+
+        self.start_engine(port=port)
+        time.sleep(0.6)  # cooldown
+
+        adapter = mascot_tts_core.resolve_adapter(config)
+        self.assertIsInstance(adapter, mascot_tts_core.VoicevoxAdapter)
+        self.assertTrue(adapter.synthesize_and_play("テスト", "Joy"))
+        self.assertFalse(adapter.transport.is_open())
+        breaker = mascot_tts_core.make_breaker_store(config)
+        self.assertEqual(breaker.get_entry(adapter.base_url), (None, False))
+
+
+
+class EnginePoolTest(MascotTTSTestCase):
+    def test_unreachable_instance_is_recorded_and_ranked_last(self):
+        engine = self.start_engine()
+        dead = free_port()
+        config = {
+            "voicevox_endpoints": f"{dead},{engine.port}",
+            "cache_dir": self.workdir,
+            "cache_max_mb": "0",
+        }
+        pool = mascot_tts_core.make_pool("voicevox", config)
+        dead_url, live_url = (m.base_url for m, _ in pool.members)
+
+        # Neither is measured yet: break the tie towards the dead instance,
+        # which fails in speaker discovery, before synthesis
+        with mock.patch("random.random", side_effect=[0.0, 1.0]):
+            self.assertTrue(pool.synthesize_and_play("テスト", "Joy"))
+        # After one failure every utterance goes to the live one first
+        for _ in range(4):
+            self.assertTrue(pool.synthesize_and_play("テスト", "Joy"))
+        self.assertEqual(pool.instance, live_url)
+        self.assertEqual(pool.ranked()[0].base_url, live_url)
+
+        stats = mascot_tts_core.pool_stats(config)
+        self.assertEqual(stats[dead_url]["errors"], 1)
+        self.assertIsNone(stats[dead_url]["latency_ms"])
+        self.assertEqual(stats[live_url]["requests"], 5)
+        self.assertEqual(stats[live_url]["errors"], 0)
+
+
+
+class AudioProcessorTest(unittest.TestCase):
+    def test_resynthesis_starts_from_the_speed_the_engine_used(self):
+        audio = mascot_tts_core.AudioProcessor(threshold=0, max_duration=2.0)
+        requested = []
+
+        # Like VOICEVOX underestimating a 4s clip: it raises speedScale to
+        # at least 1.5 up front, which still leaves 2.67s
+        def synthesize(speed):
+            requested.append(speed)
+            speed = max(speed, 1.5)
+            return make_wav(4.0 / speed), speed
+
+        wav = audio.render(synthesize, 1.0)
+        self.assertEqual(requested, [1.0, 2.0])
+        self.assertLessEqual(mascot_tts_core.wav_duration(wav), 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,15 @@ class MascotController extends ChangeNotifier {
   String? _currentEmotion;
   Map<String, double> _wanderOverrides = {};
 
+  /// Lip-sync amplitude envelope (0..1) from the signal, if provided.
+  List<double>? _envelope;
+  int _envelopeFps = 30;
+  int _envelopeStartMs = 0;
+  DateTime? _signalModified;
+
+  /// Envelope amplitude at or above which the mouth is drawn open.
+  static const double envelopeOpenThreshold = 0.3;
+
   /// True when a dismiss signal has been received.
   bool get isDismissed => _dismissed;
 
@@ -114,14 +123,19 @@ class MascotController extends ChangeNotifier {
     final speaking = file.existsSync();
     if (speaking && !_isSpeaking) {
       _isSpeaking = true;
+      _readSignalFile(file);
+      _startMouthAnimation();
+    } else if (speaking && _envelope != null) {
+      // The TTS hook rewrites the signal per streamed sentence with a new
+      // envelope; pick it up without dropping out of the speaking state.
       try {
-        final content = file.readAsStringSync().trim();
-        _parseSignalContent(content);
-      } catch (_) {
-        _message = '';
-        _setEmotion(null);
+        if (file.lastModifiedSync() != _signalModified) {
+          _readSignalFile(file);
+          _startMouthAnimation();
+        }
+      } on FileSystemException {
+        // Removed between the exists check and the stat
       }
-      _startMouthAnimation();
     } else if (!speaking && _isSpeaking) {
       _isSpeaking = false;
       _stopMouthAnimation();
@@ -142,6 +156,18 @@ class MascotController extends ChangeNotifier {
     }
   }
 
+  void _readSignalFile(File file) {
+    try {
+      _signalModified = file.lastModifiedSync();
+      final content = file.readAsStringSync().trim();
+      _parseSignalContent(content);
+    } catch (_) {
+      _message = '';
+      _envelope = null;
+      _setEmotion(null);
+    }
+  }
+
   /// Parse signal file content.
   ///
   /// Supports three formats:
@@ -149,6 +175,7 @@ class MascotController extends ChangeNotifier {
   /// - Legacy JSON: `{"message": "text", "emotion": "Joy"}`
   /// - Plain text: `text` (backward compatible, no emotion)
   void _parseSignalContent(String content) {
+    _envelope = null;
     if (content.isEmpty) {
       _message = '';
       _setEmotion(null);
@@ -162,6 +189,7 @@ class MascotController extends ChangeNotifier {
         final payload = _unwrapEnvelope(json);
         _message = (payload['message'] as String?) ?? '';
         final emotion = payload['emotion'] as String?;
+        _parseEnvelope(payload);
         _setEmotion(emotion);
         return;
       } on FormatException {
@@ -174,6 +202,20 @@ class MascotController extends ChangeNotifier {
     _setEmotion(null);
   }
 
+  /// Read the optional lip-sync envelope written by the TTS hook:
+  /// `"envelope": {"fps": 30, "values": [...]}, "started_at_ms": <epoch ms>`.
+  void _parseEnvelope(Map<String, dynamic> payload) {
+    final envelope = payload['envelope'];
+    final startedAt = payload['started_at_ms'];
+    if (envelope is! Map<String, dynamic> || startedAt is! num) return;
+    final values = envelope['values'];
+    final fps = envelope['fps'];
+    if (values is! List || fps is! num || fps <= 0) return;
+    _envelope = [for (final v in values) (v as num).toDouble()];
+    _envelopeFps = fps.toInt();
+    _envelopeStartMs = startedAt.toInt();
+  }
+
   /// Unwrap a signal envelope to extract the payload.
   /// Returns the payload map for envelope v1, or the map itself for legacy.
   static Map<String, dynamic> _unwrapEnvelope(Map<String, dynamic> json) {
@@ -210,6 +252,14 @@ class MascotController extends ChangeNotifier {
 
   void _startMouthAnimation() {
     _animTimer?.cancel();
+    final envelope = _envelope;
+    if (envelope != null) {
+      _animTimer = Timer.periodic(
+        Duration(milliseconds: 1000 ~/ _envelopeFps),
+        (_) => _applyEnvelopeFrame(envelope),
+      );
+      return;
+    }
     _animTimer = Timer.periodic(
       Duration(milliseconds: _mouthAnimationMs),
       (_) {
@@ -223,6 +273,23 @@ class MascotController extends ChangeNotifier {
     );
   }
 
+  /// Open or close the mouth from the envelope frame at the current
+  /// playback position. After the clip ends the mouth stays closed.
+  void _applyEnvelopeFrame(List<double> envelope) {
+    final elapsedMs = DateTime.now().millisecondsSinceEpoch - _envelopeStartMs;
+    final index = elapsedMs * _envelopeFps ~/ 1000;
+    final level =
+        index >= 0 && index < envelope.length ? envelope[index] : 0.0;
+    final open = level >= envelopeOpenThreshold;
+    final value = open
+        ? _modelConfig.mouthOpenValue
+        : _modelConfig.getMouthClosedValue(_currentEmotion);
+    if (_parameters[_modelConfig.mouthParam] != value) {
+      _parameters[_modelConfig.mouthParam] = value;
+      notifyListeners();
+    }
+  }
+
   void _stopMouthAnimation() {
     _animTimer?.cancel();
     _animTimer = null;
@@ -236,6 +303,7 @@ class MascotController extends ChangeNotifier {
   void showExpression(String emotion, String message) {
     _directExpression = true;
     _isSpeaking = true;
+    _envelope = null;
     _message = message;
     _setEmotion(emotion);
     _startMouthAnimation();
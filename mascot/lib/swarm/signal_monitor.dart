@@ -3,6 +3,7 @@ import 'dart:convert';
 import 'dart:io';
 
 import 'package:flutter/foundation.dart';
+import 'package:path/path.dart' as p;
 
 import 'mascot_entity.dart';
 
@@ -10,10 +11,25 @@ import 'mascot_entity.dart';
 ///
 /// One timer scans all entity signal directories, handling TTS signals
 /// and dismiss commands. Replaces per-entity MascotController polling.
+///
+/// With a [journalPath], each tick reads only the new lines of the event
+/// journal appended by mascot_tts.py and checks just the entities named
+/// there (plus those still speaking). A full scan of every signal directory
+/// runs every [fullScanEvery] ticks for writers that bypass the journal.
+/// Dismiss files are not journaled and are checked on every tick.
 class SignalMonitor {
   Timer? _timer;
   final int pollIntervalMs;
 
+  /// Shared event journal (`mascot_events.jsonl`), or null to always scan.
+  final String? journalPath;
+
+  /// Ticks between full TTS scans when the journal is in use.
+  final int fullScanEvery;
+
+  int _journalOffset = -1;
+  int _tick = 0;
+
   /// Minimum duration (ms) to keep a speech bubble visible, even if the
   /// signal file is deleted sooner (e.g. mascot_tts.py clears it after audio).
   final int minBubbleDurationMs;
@@ -33,10 +49,13 @@ class SignalMonitor {
     this.onSpeech,
     this.onSpeechEnd,
     this.onDismiss,
+    this.journalPath,
+    this.fullScanEvery = 5,
   });
 
   void start(List<MascotEntity> entities) {
     _timer?.cancel();
+    _tick = 0;
     _timer = Timer.periodic(
       Duration(milliseconds: pollIntervalMs),
       (_) => _scan(entities),
@@ -44,15 +63,78 @@ class SignalMonitor {
   }
 
   void _scan(List<MascotEntity> entities) {
+    final changed = _readJournal();
+    final full = changed == null || _tick++ % fullScanEvery == 0;
     // Iterate a snapshot: _checkDismiss may remove entities from the live list
     // via the onDismiss callback, which would cause ConcurrentModificationError.
     for (final e in List.of(entities)) {
       if (e.dismissed) continue;
-      _checkTts(e);
+      if (changed == null ||
+          full ||
+          e.isSpeaking ||
+          changed.contains(p.normalize(e.signalDir))) {
+        _checkTts(e);
+      }
       _checkDismiss(e);
     }
   }
 
+  /// Return the signal dirs named in journal lines appended since the last
+  /// call, or null when a full scan is needed (no journal, unreadable, or
+  /// rotated since the last read).
+  Set<String>? _readJournal() {
+    final path = journalPath;
+    if (path == null) return null;
+    final file = File(path);
+    try {
+      if (!file.existsSync()) {
+        // Not written yet (or written elsewhere): treat it as new once it
+        // appears
+        _journalOffset = -1;
+        return null;
+      }
+      final length = file.lengthSync();
+      if (_journalOffset < 0) {
+        // First tick: skip history, the full scan picks up current state
+        _journalOffset = length;
+        return null;
+      }
+      if (length < _journalOffset) {
+        _journalOffset = 0;
+        return null;
+      }
+      if (length == _journalOffset) return const {};
+
+      final raf = file.openSync();
+      final List<int> bytes;
+      try {
+        raf.setPositionSync(_journalOffset);
+        bytes = raf.readSync(length - _journalOffset);
+      } finally {
+        raf.closeSync();
+      }
+      // Only consume complete lines; a partial one is read next tick
+      final end = bytes.lastIndexOf(0x0A);
+      if (end < 0) return const {};
+      _journalOffset += end + 1;
+
+      final changed = <String>{};
+      final lines = utf8.decode(bytes.sublist(0, end), allowMalformed: true);
+      for (final line in const LineSplitter().convert(lines)) {
+        try {
+          final event = jsonDecode(line) as Map<String, dynamic>;
+          final dir = event['signal_dir'] as String?;
+          if (dir != null) changed.add(p.normalize(dir));
+        } catch (_) {
+          // Skip malformed lines
+        }
+      }
+      return changed;
+    } on FileSystemException {
+      return null;
+    }
+  }
+
   void _checkTts(MascotEntity e) {
     final file = File('${e.signalDir}/mascot_speaking');
     final exists = file.existsSync();
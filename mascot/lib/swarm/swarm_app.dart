@@ -88,6 +88,7 @@ class _SwarmAppState extends State<SwarmApp> with TickerProviderStateMixin {
 
     _signalMonitor = SignalMonitor(
       pollIntervalMs: widget.config.signalPollMs,
+      journalPath: '${widget.signalDir}/mascot_events.jsonl',
       onSpeech: _onEntitySpeech,
       onSpeechEnd: _onEntitySpeechEnd,
       onDismiss: _onEntityDismiss,
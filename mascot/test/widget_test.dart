@@ -9,6 +9,8 @@ import 'package:path/path.dart' as p;
 import 'package:mascot/cut_in_overlay.dart';
 import 'package:mascot/mascot_controller.dart';
 import 'package:mascot/model_config.dart';
+import 'package:mascot/swarm/mascot_entity.dart';
+import 'package:mascot/swarm/signal_monitor.dart';
 import 'package:mascot/wander_controller.dart';
 import 'package:mascot/window_config.dart';
 
@@ -933,6 +935,39 @@ void main() {
       expect(controller.isSpeaking, true);
     });
 
+    test('lip-sync envelope drives the mouth from amplitude', () async {
+      final signal = File('${signalDir.path}/mascot_speaking');
+      signal.writeAsStringSync(jsonEncode({
+        'version': '1',
+        'type': 'mascot.speech',
+        'payload': {
+          'message': '口パク',
+          'envelope': {'fps': 30, 'values': List.filled(90, 1.0)},
+          'started_at_ms': DateTime.now().millisecondsSinceEpoch,
+        },
+      }));
+
+      await Future<void>.delayed(const Duration(milliseconds: 250));
+      expect(controller.isSpeaking, true);
+      expect(controller.showOpenMouth, true);
+
+      // A silent envelope keeps the mouth closed instead of toggling
+      await Future<void>.delayed(const Duration(milliseconds: 20));
+      signal.writeAsStringSync(jsonEncode({
+        'version': '1',
+        'type': 'mascot.speech',
+        'payload': {
+          'message': '無音',
+          'envelope': {'fps': 30, 'values': List.filled(90, 0.0)},
+          'started_at_ms': DateTime.now().millisecondsSinceEpoch,
+        },
+      }));
+
+      await Future<void>.delayed(const Duration(milliseconds: 400));
+      expect(controller.message, '無音');
+      expect(controller.showOpenMouth, false);
+    });
+
     test('spawn signal envelope is unwrapped correctly', () {
       final envelope = jsonEncode({
         'version': '1',
@@ -972,6 +1007,88 @@ void main() {
     });
   });
 
+  // ── SignalMonitor Journal Tests ───────────────────────────
+
+  group('SignalMonitor event journal', () {
+    late Directory rootDir;
+    late String journalPath;
+    late List<MascotEntity> entities;
+    late SignalMonitor monitor;
+    final spoken = <String>[];
+
+    setUp(() {
+      rootDir = Directory.systemTemp.createTempSync('journal_test_');
+      journalPath = '${rootDir.path}/mascot_events.jsonl';
+      File(journalPath).createSync();
+      entities = [
+        for (final id in ['a', 'b'])
+          MascotEntity(
+            x: 0,
+            y: 0,
+            speed: 1,
+            signalDir: (Directory('${rootDir.path}/task-$id')
+                  ..createSync())
+                .path,
+          ),
+      ];
+      spoken.clear();
+      monitor = SignalMonitor(
+        pollIntervalMs: 50,
+        journalPath: journalPath,
+        fullScanEvery: 1000,
+        onSpeech: (e, message, emotion) => spoken.add(message),
+      )..start(entities);
+    });
+
+    tearDown(() {
+      monitor.dispose();
+      rootDir.deleteSync(recursive: true);
+    });
+
+    test('only entities named in the journal are checked', () async {
+      // Let the initial full scan pass
+      await Future<void>.delayed(const Duration(milliseconds: 100));
+
+      for (final e in entities) {
+        File('${e.signalDir}/mascot_speaking').writeAsStringSync(
+          jsonEncode({'message': p.basename(e.signalDir)}),
+        );
+      }
+      await Future<void>.delayed(const Duration(milliseconds: 150));
+      expect(spoken, isEmpty);
+
+      File(journalPath).writeAsStringSync(
+        '${jsonEncode({'event': 'speak', 'signal_dir': entities[1].signalDir})}\n',
+        mode: FileMode.append,
+      );
+      await Future<void>.delayed(const Duration(milliseconds: 150));
+      expect(spoken, ['task-b']);
+      expect(entities[0].isSpeaking, false);
+      expect(entities[1].isSpeaking, true);
+    });
+
+    test('rotated journal falls back to a full scan', () async {
+      File(journalPath).writeAsStringSync('${'x' * 100}\n');
+      await Future<void>.delayed(const Duration(milliseconds: 100));
+
+      File('${entities[0].signalDir}/mascot_speaking')
+          .writeAsStringSync('ローテーション');
+      File(journalPath).writeAsStringSync('');
+      await Future<void>.delayed(const Duration(milliseconds: 150));
+      expect(spoken, ['ローテーション']);
+    });
+
+    test('missing journal falls back to full scans every tick', () async {
+      File(journalPath).deleteSync();
+      await Future<void>.delayed(const Duration(milliseconds: 100));
+
+      File('${entities[1].signalDir}/mascot_speaking')
+          .writeAsStringSync('ジャーナルなし');
+      await Future<void>.delayed(const Duration(milliseconds: 150));
+      expect(spoken, ['ジャーナルなし']);
+    });
+  });
+
   // ── WindowConfig Tests (#38) ──────────────────────────────
 
   group('WindowConfig', () {